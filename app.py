@@ -1,50 +1,72 @@
-import firebase_admin
-from firebase_admin import credentials, auth, firestore
-from fastapi import FastAPI, Header, HTTPException, Depends, UploadFile, File, Form
+from firebase_admin import firestore
+from fastapi import FastAPI, Header, HTTPException, Depends, Query, Response, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
+import io
 from typing import Dict, Any, List, Optional
 from pydantic import BaseModel
 from datetime import datetime
-from visual_summary import generate_visual_summary_json
+from visual_summary import (generate_visual_summary_json, generate_visual_summary_text, generate_section_image,
+                            SECTION_CONCURRENCY, SUMMARY_MODEL, SUMMARY_PROMPT_VERSION)
 import logging
 import uvicorn
-from quiz import generate_quiz_json
-from call_gemini import generate_response
+from quiz import generate_quiz_json, QUIZ_MODEL, QUIZ_PROMPT_VERSION
+from call_gemini import generate_response, stream_response
 from demo_assignment_generator import AssignmentGenerator
 from demo_GradeSubmissions import AssignmentChecker
 from demo_uploadAssignment import UploadAssignment
-import tempfile
+from token_cache import TokenVerifier
+from grading_engine import GradingEngine
+from grade_writer import GradeWriter
+from submission_store import SubmissionStore
+from ingestion import IngestionQueue
+from uploads import UploadTooLarge, BodySizeLimitMiddleware
+from registry import registry
+from generation_cache import GenerationCache, cache_key
+from pdf_cache import PdfCache
+from pagination import fetch_page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from chat_memory import ChatMemory
+from user_loader import UserProfileLoader
+from memberships import MembershipIndex, ClassroomNotFound, TEACHER, STUDENT
+from join_codes import JoinCodeRegistry
+import asyncio
+from contextlib import asynccontextmanager
 import os
-import random
-import string
 import json
-from sentence_transformers import SentenceTransformer, util
-import base64
-import torch
 # Pip installs:
 # pip install firebase-admin fastapi uvicorn pydantic
 
-# Initialize Firebase Admin SDK
-try:
-    firebase_creds_base64 = os.environ.get('FIREBASE_ADMIN_CREDENTIALS_B64')
-    
-    if not firebase_creds_base64:
-        # Fallback to local file for development
-        cred = credentials.Certificate("tibby-teach-firebase-adminsdk-fbsvc-a51c5b7b7b.json")
-    else:
-        # Decode and load credentials from base64
-        decoded_json = base64.b64decode(firebase_creds_base64).decode("utf-8")
-        cred_dict = json.loads(decoded_json)
-        cred = credentials.Certificate(cred_dict)
-
-    firebase_admin.initialize_app(cred)
-
-except Exception as e:
-    print(f"Failed to initialize Firebase: {str(e)}")
-    raise
-
-db = firestore.client()
-app = FastAPI()
+db = registry.db
+repo = registry.repo
+token_verifier = TokenVerifier()
+submission_store = SubmissionStore(repo)
+grade_writer = GradeWriter(repo, submission_store)
+generation_cache = GenerationCache(repo)
+pdf_cache = PdfCache()
+chat_memory = ChatMemory(repo)
+user_loader = UserProfileLoader(repo)
+memberships = MembershipIndex(repo)
+join_codes = JoinCodeRegistry(repo)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Firestore and Gemini clients are cheap; the vector store and embedding model
+    # load in the background so the worker serves traffic (and /health) right away
+    await asyncio.to_thread(lambda: registry.gemini_model)
+    app.state.warm_up = asyncio.create_task(asyncio.to_thread(registry.warm_up))
+    token_verifier.start()
+    await ingestion_queue.start()
+    yield
+    await ingestion_queue.stop()
+    await submission_store.flush()
+    token_verifier.stop()
+    registry.close()
+
+app = FastAPI(lifespan=lifespan)
+
+# Innermost, so its 413s still get CORS headers
+app.add_middleware(BodySizeLimitMiddleware)
 
 # Update CORS settings
 origins = [
@@ -58,17 +80,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Before-Cursor", "X-After-Cursor", "ETag", "Content-Disposition"],
 )
 
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """GZip responses except the streaming endpoints, which must flush every event as it is produced"""
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].rstrip("/").endswith("/stream"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+app.add_middleware(SelectiveGZipMiddleware, minimum_size=1000)
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-try:
-    model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-except Exception as e:
-    logger.error(f"Failed to load sentence transformer model: {str(e)}")
-    model = None
-
 # Pydantic Models for Request/Response Data
 class User(BaseModel):
     role: str
@@ -121,57 +148,131 @@ class GradeRequest(BaseModel):
     useAI: bool = False
 
 
-def verify_token(id_token: str) -> Dict[str, Any]:
+def get_grading_engine() -> Optional[GradingEngine]:
+    model = registry.embedding_model
+    return GradingEngine(model) if model is not None else None
+
+def get_upload_handler() -> Optional[UploadAssignment]:
+    model = registry.embedding_model
+    if model is None:
+        return None
+    return UploadAssignment(db=registry.db, embedding_model=model, collection=registry.chroma_collection)
+
+def get_assignment_generator() -> AssignmentGenerator:
+    return AssignmentGenerator(model=registry.gemini_model)
+
+async def verify_token(id_token: str) -> Dict[str, Any]:
     try:
-        decoded_token = auth.verify_id_token(id_token)
+        decoded_token = await token_verifier.verify(id_token)
         return decoded_token
     except Exception as e:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-def get_user_id(authorization: str = Header(None)) -> str:
-    print(authorization)
+async def get_user_id(authorization: str = Header(None)) -> str:
     if not authorization:
         raise HTTPException(status_code=401, detail="Authorization header missing")
+    if not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Invalid authorization header")
 
-    id_token = authorization.split("Bearer ")[1]
-    decoded_token = verify_token(id_token)
+    id_token = authorization[len("Bearer "):]
+    decoded_token = await verify_token(id_token)
     return decoded_token["uid"]
 
 
-@app.post("/chat_with_memory/")
-async def chat_with_memory(request: ChatRequest, user_id: str = Depends(get_user_id)):
-    chat_ref = db.collection("chats").document(request.chatId)
-    messages_ref = chat_ref.collection("messages").order_by("timestamp").limit(10)  # Fetch last 10 messages
-    
-    # Load recent messages
-    messages = []
-    for msg in messages_ref.stream():
-        msg_data = msg.to_dict()
-        messages.append({
-            "role": "user" if msg_data["senderId"] == user_id else "bot",
-            "text": msg_data["text"]
-        })
-
-    # Prepare prompt for Gemini (rolling window)
-    chat_history = "\n".join([f"{m['role']}: {m['text']}" for m in messages[-10:]])
-    user_prompt = f"{chat_history}\nUser: {request.userMessage}\nAssistant:"
-
-    # Call Gemini API
-    response = generate_response(user_prompt)
+def chat_user_message(request: ChatRequest, user_id: str) -> Dict[str, Any]:
+    return {
+        "senderId": user_id,
+        "text": request.userMessage,
+        "chatId": request.chatId,
+        "timestamp": firestore.SERVER_TIMESTAMP,
+    }
 
-    # Save AI-generated response in Firestore under messages subcollection
-    new_message_ref = chat_ref.collection("messages").document()
-    new_message_ref.set({
+def chat_ai_message(text: str) -> Dict[str, Any]:
+    return {
         "senderId": "ai",
-        "text": response.text,
+        "text": text,
         "timestamp": firestore.SERVER_TIMESTAMP,
         "ragMetadata": {},  # No RAG, so keeping it empty
         "retrievalAugmentedGeneration": "",
         "generatedFileId": None
-    })
+    }
 
+@app.post("/chat_with_memory/")
+async def chat_with_memory(request: ChatRequest, user_id: str = Depends(get_user_id)):
+    chat_ref = db.collection("chats").document(request.chatId)
+    context = await chat_memory.load(chat_ref, user_id)
+    user_prompt = chat_memory.build_prompt(context, request.userMessage)
+
+    # Store the user's message while Gemini answers; it is written before the reply so it sorts first
+    user_message_ref = chat_ref.collection("messages").document()
+    _, response = await asyncio.gather(
+        repo.set(user_message_ref, chat_user_message(request, user_id)),
+        generate_response(user_prompt),
+    )
+
+    # Save AI-generated response in Firestore under messages subcollection
+    new_message_ref = chat_ref.collection("messages").document()
+    await repo.set(new_message_ref, chat_ai_message(response.text))
+
+    chat_memory.maybe_summarize(chat_ref, context)
     return {"response": response.text}
 
+@app.post("/chat_with_memory/stream/")
+async def chat_with_memory_stream(request: ChatRequest, user_id: str = Depends(get_user_id)):
+    """
+    Same as /chat_with_memory/ but streams the reply as Server-Sent Events:
+    "token" events carry text as Gemini produces it, then "done" carries the
+    full response and the stored messageId (or "error" if generation failed).
+    The complete reply is saved to the messages subcollection once the stream ends.
+    """
+    chat_ref = db.collection("chats").document(request.chatId)
+    context = await chat_memory.load(chat_ref, user_id)
+    user_prompt = chat_memory.build_prompt(context, request.userMessage)
+
+    def sse(event: str, data: Dict[str, Any]) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    async def events():
+        user_message_ref = chat_ref.collection("messages").document()
+        store_user_message = asyncio.ensure_future(repo.set(user_message_ref, chat_user_message(request, user_id)))
+        pieces = []
+        try:
+            async for text in stream_response(user_prompt):
+                pieces.append(text)
+                yield sse("token", {"text": text})
+        except Exception as e:
+            logger.error(f"Error streaming chat response: {str(e)}")
+            await store_user_message
+            yield sse("error", {"detail": "Failed to generate response"})
+            return
+
+        await store_user_message
+        response_text = "".join(pieces)
+        new_message_ref = chat_ref.collection("messages").document()
+        await repo.set(new_message_ref, chat_ai_message(response_text))
+        chat_memory.maybe_summarize(chat_ref, context)
+        yield sse("done", {"response": response_text, "messageId": new_message_ref.id})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# React Example:
+# async function streamChat(chatId, userMessage, idToken, onToken) {
+#   const response = await fetch('/chat_with_memory/stream/', {
+#     method: 'POST',
+#     headers: {
+#       'Content-Type': 'application/json',
+#       'Authorization': `Bearer ${idToken}`
+#     },
+#     body: JSON.stringify({ chatId, userMessage })
+#   });
+#   const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+#   // Parse "event:" / "data:" lines and call onToken(JSON.parse(data).text) for token events
+# }
+
 
 @app.post("/users/", response_model=Dict[str, str])
 async def create_user(user: User, user_id: str = Depends(get_user_id)):
@@ -181,7 +282,8 @@ async def create_user(user: User, user_id: str = Depends(get_user_id)):
         user_data["teachingClassrooms"] = []
     else:
         user_data["enrolledClassrooms"] = []
-    db.collection("users").document(user_id).set(user_data)
+    await repo.set(db.collection("users").document(user_id), user_data)
+    user_loader.invalidate(user_id)
     return {"message": "User created successfully"}
 
 # React Example:
@@ -200,7 +302,7 @@ async def create_user(user: User, user_id: str = Depends(get_user_id)):
 
 @app.get("/users/{user_id}", response_model=User)
 async def get_user(user_id: str):
-    user_doc = db.collection("users").document(user_id).get()
+    user_doc = await repo.get(db.collection("users").document(user_id))
     print(user_doc.to_dict())
     if not user_doc.exists:
         raise HTTPException(status_code=404, detail="User not found")
@@ -217,18 +319,35 @@ async def get_user(user_id: str):
 #   return data;
 # }
 
+# Metadata returned by the file listing; jsonData is only served by /files/{file_id}
+FILE_LISTING_FIELDS = ["userId", "fileName", "fileType", "chatId", "uploadTimestamp"]
+
 @app.get("/files/list/", response_model=List[Dict[str, Any]])
-async def get_user_files(user_id: str = Depends(get_user_id)):
+async def get_user_files(
+    response: Response,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    user_id: str = Depends(get_user_id)
+):
     """
-    Fetch all files created by the authenticated user.
-    Returns a list of file objects with fileId and other metadata.
+    Fetch a page of the authenticated user's files, newest first.
+    Returns fileId and metadata only (no jsonData); pass the X-Before-Cursor
+    header back as `before` for the next page. Needs the composite indexes in
+    firestore.indexes.json, and files without uploadTimestamp are only listed
+    once scripts/backfill_upload_timestamps.py has run.
     """
     try:
         logger.info(f"Fetching files for user: {user_id}")
-        files_ref = db.collection("files").where("userId", "==", user_id).stream()
-        files = [{"fileId": file.id, **file.to_dict()} for file in files_ref]
+        page = await fetch_page(repo, db.collection("files"), order_field="uploadTimestamp", limit=limit,
+                                before=before, after=after, newest_first=True,
+                                where=("userId", "==", user_id), field_paths=FILE_LISTING_FIELDS)
+        files = [{"fileId": file.id, **file.to_dict()} for file in page.snapshots]
         logger.info(f"Found {len(files)} files")
+        response.headers.update(page.headers())
         return files
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching files: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching files")
@@ -240,7 +359,7 @@ async def upload_file(file: File, user_id: str = Depends(get_user_id)):
     file_data["uploadTimestamp"] = firestore.SERVER_TIMESTAMP
     file_ref = db.collection("files").document()
     file_id = file_ref.id
-    file_ref.set(file_data)
+    await repo.set(file_ref, file_data)
     return {"fileId": file_id}
 
 # React Example:
@@ -263,7 +382,7 @@ async def get_file_by_id(file_id: str, user_id: str = Depends(get_user_id)):
     Fetch a specific file by ID. Also verifies that the requesting user owns the file.
     """
     try:
-        file_doc = db.collection("files").document(file_id).get()
+        file_doc = await repo.get(db.collection("files").document(file_id))
         if not file_doc.exists:
             raise HTTPException(status_code=404, detail="File not found")
             
@@ -297,7 +416,7 @@ async def create_chat(chat: Chat, user_id: str = Depends(get_user_id)):
     chat_data["startTimestamp"] = firestore.SERVER_TIMESTAMP
     chat_ref = db.collection("chats").document()
     chat_id = chat_ref.id
-    chat_ref.set(chat_data)
+    await repo.set(chat_ref, chat_data)
     return {"chatId": chat_id}
 
 # React Example:
@@ -320,7 +439,7 @@ async def get_user_chats(user_id: str = Depends(get_user_id)):
     Fetch all chats created by the authenticated user.
     Returns a list of chat objects with chatId, title, and startTimestamp.
     """
-    chats_ref = db.collection("chats").where("userId", "==", user_id).stream()
+    chats_ref = await repo.stream(db.collection("chats").where("userId", "==", user_id))
     chats = [{"chatId": chat.id, **chat.to_dict()} for chat in chats_ref]
     if not chats:
         return []  # Return empty list if no chats exist
@@ -330,7 +449,7 @@ async def get_user_chats(user_id: str = Depends(get_user_id)):
 
 @app.get("/chats/{chat_id}", response_model=Chat)
 async def get_chat(chat_id: str):
-    chat_doc = db.collection("chats").document(chat_id).get()
+    chat_doc = await repo.get(db.collection("chats").document(chat_id))
     if not chat_doc.exists:
         raise HTTPException(status_code=404, detail="Chat not found")
     return Chat(**chat_doc.to_dict())
@@ -354,7 +473,7 @@ async def send_message(message: Message, user_id: str = Depends(get_user_id)):
     chat_ref = db.collection("chats").document(message_data["chatId"])
     message_ref = chat_ref.collection("messages").document()
     message_id = message_ref.id
-    message_ref.set(message_data)
+    await repo.set(message_ref, message_data)
     return {"messageId": message_id}
 
 # React Example:
@@ -373,41 +492,86 @@ async def send_message(message: Message, user_id: str = Depends(get_user_id)):
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Liveness: the worker is up and serving, whether or not the models have loaded"""
     return {
         "status": "healthy",
+        "ready": registry.ready,
         "timestamp": datetime.utcnow().isoformat(),
         "version": "1.0.0"
     }
 
+@app.get("/health/ready")
+async def readiness_check(response: Response):
+    """Readiness: 503 until the embedding model and vector store have finished loading"""
+    components = registry.status()
+    if registry.ready:
+        status = "ready"
+    else:
+        response.status_code = 503
+        status = "failed" if "failed" in components.values() else "starting"
+    return {
+        "status": status,
+        "components": components,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
 @app.get("/messages/{chat_id}", response_model=List[Dict[str, Any]])
-async def get_messages(chat_id: str):
-    messages_ref = db.collection("chats").document(chat_id).collection("messages").order_by("timestamp")
-    messages = []
-    for message_doc in messages_ref.stream():
-        messages.append(message_doc.to_dict())
-    return messages
+async def get_messages(
+    chat_id: str,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+):
+    """
+    Latest page of a chat's messages, oldest first. Use the X-Before-Cursor
+    header as `before` to load older history and X-After-Cursor as `after` to
+    poll for new messages.
+    """
+    messages_ref = db.collection("chats").document(chat_id).collection("messages")
+    try:
+        page = await fetch_page(repo, messages_ref, limit=limit, before=before, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers.update(page.headers())
+    return page.items
 
 # React Example:
-# async function getMessages(chatId, idToken) {
-#   const response = await fetch(`/messages/${chatId}`, {
+# async function getMessages(chatId, idToken, before = null) {
+#   const query = before ? `?before=${encodeURIComponent(before)}` : '';
+#   const response = await fetch(`/messages/${chatId}${query}`, {
 #     headers: {
 #       'Authorization': `Bearer ${idToken}`
 #     }
 #   });
 #   const data = await response.json();
-#   return data;
+#   return { messages: data, before: response.headers.get('X-Before-Cursor') };
 # }
 
 ####################################################### Learning Aids ######################################################################
 
+def is_complete_summary(visual_summary) -> bool:
+    """Only cache summaries where every section got its image."""
+    sections = (visual_summary or {}).get("sections") or []
+    return bool(sections) and all(section.get("imageUrl") for section in sections)
+
+@app.get("/cache/stats")
+async def generation_cache_stats(user_id: str = Depends(get_user_id)):
+    """Hit/miss counters for the quiz and visual summary generation cache"""
+    return generation_cache.stats()
+
 @app.post("/visualsummary/")
 async def visualsummary(request: VisualSummaryRequest, user_id: str = Depends(get_user_id)):
     logger.info(f"Received request: topic={request.topic}, rag={request.rag}")
     topic = request.topic
-    visual_summary = generate_visual_summary_json(topic, request.rag)
+    key = cache_key("visualsummary", SUMMARY_MODEL, SUMMARY_PROMPT_VERSION, topic, request.rag)
+    visual_summary = await generation_cache.get_or_generate(
+        "visualsummary", key,
+        lambda: generate_visual_summary_json(topic, request.rag),
+        should_cache=is_complete_summary
+    )
     file_ref = db.collection("files").document()
-    file_ref.set({
+    await repo.set(file_ref, {
         "userId": user_id,
         "fileName": f"{topic}_visual_summary.json",
         "fileType": "ai_generated",
@@ -418,13 +582,76 @@ async def visualsummary(request: VisualSummaryRequest, user_id: str = Depends(ge
     logger.info(f"Returning response: {response}")
     return response
 
+@app.post("/visualsummary/stream/")
+async def visualsummary_stream(request: VisualSummaryRequest, user_id: str = Depends(get_user_id)):
+    """
+    Stream a visual summary as newline-delimited JSON events:
+    a "summary" event with the text skeleton and fileId as soon as it exists,
+    one "section" event per imageUrl as each image is uploaded, then "done".
+    The files document is created with the skeleton and updated per section.
+    """
+    logger.info(f"Received streaming request: topic={request.topic}, rag={request.rag}")
+    topic = request.topic
+
+    key = cache_key("visualsummary", SUMMARY_MODEL, SUMMARY_PROMPT_VERSION, topic, request.rag)
+
+    async def events():
+        cached = await generation_cache.get(key)
+        visual_summary = cached or await generate_visual_summary_text(topic, request.rag)
+        if visual_summary is None:
+            yield json.dumps({"event": "error", "detail": "Failed to generate visual summary"}) + "\n"
+            return
+
+        file_ref = db.collection("files").document()
+        await repo.set(file_ref, {
+            "userId": user_id,
+            "fileName": f"{topic}_visual_summary.json",
+            "fileType": "ai_generated",
+            "jsonData": visual_summary,
+            "uploadTimestamp": firestore.SERVER_TIMESTAMP
+        })
+        yield json.dumps({"event": "summary", "fileId": file_ref.id, "jsonData": visual_summary}) + "\n"
+        if cached:
+            yield json.dumps({"event": "done", "fileId": file_ref.id}) + "\n"
+            return
+
+        sections = visual_summary.get("sections", [])
+        semaphore = asyncio.Semaphore(SECTION_CONCURRENCY)
+
+        async def indexed(index, section):
+            await generate_section_image(section, semaphore)
+            return index, section
+
+        tasks = [asyncio.ensure_future(indexed(i, section)) for i, section in enumerate(sections)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, section = await next_done
+                if not section.get("imageUrl"):
+                    continue
+                # Arrays can't be patched by index, so rewrite the sections list
+                await repo.update(file_ref, {"jsonData.sections": sections})
+                yield json.dumps({"event": "section", "index": index, "imageUrl": section["imageUrl"]}) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+        if is_complete_summary(visual_summary):
+            await generation_cache.put(key, visual_summary, "visualsummary")
+        yield json.dumps({"event": "done", "fileId": file_ref.id}) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
 @app.post("/quiz/")
 async def generate_quiz(request: QuizRequest, user_id: str = Depends(get_user_id)):
     logger.info(f"Received quiz request: topic={request.topic}, rag={request.rag}")
     topic = request.topic
-    quiz_data = generate_quiz_json(topic, request.rag)
+    key = cache_key("quiz", QUIZ_MODEL, QUIZ_PROMPT_VERSION, topic, request.rag)
+    quiz_data = await generation_cache.get_or_generate(
+        "quiz", key,
+        lambda: generate_quiz_json(topic, request.rag),
+        should_cache=lambda quiz: bool(quiz and quiz.get("questions"))
+    )
     file_ref = db.collection("files").document()
-    file_ref.set({
+    await repo.set(file_ref, {
         "userId": user_id,
         "fileName": f"{topic}_quiz.json",
         "fileType": "ai_generated",
@@ -439,36 +666,49 @@ async def generate_quiz(request: QuizRequest, user_id: str = Depends(get_user_id
 async def update_file(file_id: str, file: File, user_id: str = Depends(get_user_id)):
     print(f"Received PATCH request for file: {file_id}")
     print(f"Payload: {file.model_dump_json()}")
-    file_doc = db.collection("files").document(file_id).get()
+    file_doc = await repo.get(db.collection("files").document(file_id))
     if not file_doc.exists:
         raise HTTPException(status_code=404, detail="File not found")
     if file_doc.to_dict()["userId"] != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to update this file")
     
     file_data = file.model_dump(exclude_unset=True)
-    db.collection("files").document(file_id).update(file_data)
+    await repo.update(db.collection("files").document(file_id), file_data)
     return {"message": "File updated successfully"}
 
 # Classroom Routes
+async def require_member(classroom_id: str, user_id: str, teacher_only: bool = False,
+                         detail: str = "Not authorized") -> str:
+    """Authorize against the membership index and return the caller's role"""
+    try:
+        role = await memberships.role(classroom_id, user_id)
+    except ClassroomNotFound:
+        raise HTTPException(status_code=404, detail="Classroom not found")
+    if role is None or (teacher_only and role != TEACHER):
+        raise HTTPException(status_code=403, detail=detail)
+    return role
+
 @app.get("/api/classrooms/{classroom_id}")
 async def get_classroom(classroom_id: str, user_id: str = Depends(get_user_id)):
-    classroom_doc = db.collection("classrooms").document(classroom_id).get()
+    # Check if user has access (is teacher or enrolled student)
+    await require_member(classroom_id, user_id)
+
+    classroom_doc, students = await asyncio.gather(
+        repo.get(db.collection("classrooms").document(classroom_id)), memberships.students(classroom_id)
+    )
     if not classroom_doc.exists:
         raise HTTPException(status_code=404, detail="Classroom not found")
     
     classroom_data = classroom_doc.to_dict()
-    # Check if user has access (is teacher or enrolled student)
-    if (classroom_data["teacherId"] != user_id and 
-        user_id not in classroom_data.get("students", {})):
-        raise HTTPException(status_code=403, detail="Not authorized")
-    
+    # Older classrooms still carry part of the roster in the legacy map
+    classroom_data["students"] = {**classroom_data.get("students", {}), **students}
     return {"id": classroom_id, **classroom_data}
 
 @app.get("/api/classrooms/{classroom_id}/assignments")
 async def get_classroom_assignments(classroom_id: str, user_id: str = Depends(get_user_id)):
     assignments_ref = db.collection("classrooms").document(classroom_id).collection("assignments")
     assignments = []
-    for doc in assignments_ref.stream():
+    for doc in await repo.stream(assignments_ref):
         assignment_data = doc.to_dict()
         # Add classroom ID and assignment ID to each assignment
         assignments.append({
@@ -482,17 +722,16 @@ async def get_classroom_assignments(classroom_id: str, user_id: str = Depends(ge
 async def create_classroom_assignment(
     classroom_id: str,
     assignment: AssignmentGenerationRequest,
-    user_id: str = Depends(get_user_id)
+    user_id: str = Depends(get_user_id),
+    generator: AssignmentGenerator = Depends(get_assignment_generator)
 ):
     # Verify user is teacher
-    classroom = db.collection("classrooms").document(classroom_id).get()
-    if not classroom.exists or classroom.to_dict()["teacherId"] != user_id:
-        raise HTTPException(status_code=403, detail="Not authorized")
+    await require_member(classroom_id, user_id, teacher_only=True)
     
-    generator = AssignmentGenerator()
     question_details = [{"type": "TEXT", "marks": 100 // assignment.num_questions} for _ in range(assignment.num_questions)]
     
-    result = generator.generate_assignment(
+    result = await asyncio.to_thread(
+        generator.generate_assignment,
         topic=assignment.topic,
         credentials_file_path=None,
         question_details=question_details,
@@ -507,14 +746,15 @@ async def create_classroom_assignment(
 
     # Save to Firestore with submissionCount
     assignment_ref = db.collection("classrooms").document(classroom_id).collection("assignments").document()
-    assignment_ref.set({
+    await repo.set(assignment_ref, {
         "title": assignment.topic,
         "description": result.get("content", {}).get("description", ""),
         "dueDate": None,  # Teacher can set this later
         "createdAt": firestore.SERVER_TIMESTAMP,
         "totalPoints": 100,
         "questions": result.get("content", {}).get("questions", []),
-        "submissionCount": 0  # Initialize submission count
+        "submissionCount": 0,  # Initialize submission count
+        "submissionCountBase": 0  # No submissions predate the counter shards
     })
     
     return {"id": assignment_ref.id, **result}
@@ -531,18 +771,17 @@ async def submit_assignment(
     classroom_ref = db.collection("classrooms").document(classroom_id)
     assignment_ref = classroom_ref.collection("assignments").document(assignment_id)
     
-    if not classroom_ref.get().exists:
+    submission_ref = assignment_ref.collection("submissions").document(user_id)
+    classroom_doc, assignment_doc, previous = await asyncio.gather(
+        repo.get(classroom_ref),
+        repo.get(assignment_ref),
+        repo.run(submission_ref.get, field_paths=["fileUrl", "ingestionStatus"]),
+    )
+    if not classroom_doc.exists:
         raise HTTPException(status_code=404, detail="Classroom not found")
-    if not assignment_ref.get().exists:
+    if not assignment_doc.exists:
         raise HTTPException(status_code=404, detail="Assignment not found")
 
-    # Check if student has already submitted
-    assignment_doc = assignment_ref.get()
-    assignment_data = assignment_doc.to_dict()
-    submissions = assignment_data.get("submissions", {})
-    
-    is_resubmission = user_id in submissions
-    
     # Parse the answers JSON
     try:
         answers = json.loads(answer_text)
@@ -559,45 +798,92 @@ async def submit_assignment(
         "studentId": user_id,
     }
 
-    submission_id = None
-    # Handle file upload if provided
+    job = None
+    # Handle file upload if provided: store it now, extract and index it in the background
     if file:
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
-            content = await file.read()
-            tmp.write(content)
-            tmp_path = tmp.name
-
+        if registry.status()["embedding_model"] == "failed":
+            raise HTTPException(status_code=503, detail="File submissions are not available - model failed to load")
+        suffix = os.path.splitext(file.filename or "")[1].lower() or ".pdf"
         try:
-            upload_handler = UploadAssignment()
-            submission_id = upload_handler.upload_submission(
-                file_path=tmp_path,
-                assignment_id=assignment_id,
-                student_id=user_id
-            )
-            if submission_id:
-                submission_data["fileUrl"] = tmp_path  # In production, this would be a cloud storage URL
-        finally:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
+            # Streamed to disk in chunks, so memory stays flat whatever the file size
+            job = await ingestion_queue.store(file, suffix, {
+                "classroom_id": classroom_id,
+                "assignment_id": assignment_id,
+                "student_id": user_id,
+            })
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        submission_data["fileUrl"] = job.file_path  # In production, this would be a cloud storage URL
+        submission_data["ingestionStatus"] = "queued"
+        submission_data["ingestionJobId"] = job.id
+
+    # The submissions subcollection is the source of truth; the count is sharded and
+    # the assignment's summary map is updated in the background
+    try:
+        await submission_store.submit(assignment_ref, user_id, submission_data)
+    except Exception:
+        if job:
+            await asyncio.to_thread(ingestion_queue.discard, job)
+        raise
+    if job:
+        ingestion_queue.submit(job)
+
+    # The previous upload is no longer referenced. If it finished ingesting, delete it
+    # now; a job still queued or processing deletes its own file once it sees it was replaced
+    previous_data = (previous.to_dict() or {}) if previous.exists else {}
+    previous_file = previous_data.get("fileUrl")
+    if previous_file and previous_file != submission_data.get("fileUrl") \
+            and previous_data.get("ingestionStatus") in ("indexed", "failed"):
+        await asyncio.to_thread(ingestion_queue.remove_file, previous_file)
+    
+    return {"status": "success", "submissionId": user_id, "ingestionStatus": submission_data.get("ingestionStatus")}
 
-    # Update the submission in a subcollection for better organization
-    submission_ref = assignment_ref.collection("submissions").document(user_id)
-    submission_ref.set(submission_data)
-
-    # Update the assignment metadata
-    batch = db.batch()
-    if not is_resubmission:
-        batch.update(assignment_ref, {
-            "submissionCount": firestore.Increment(1),
-            f"submissions.{user_id}": {
-                "submittedAt": firestore.SERVER_TIMESTAMP,
-                "status": "pending_review"
-            }
+async def ingest_submission(job):
+    """
+    Extract, embed and index an uploaded submission file, recording progress on the submission.
+    The file is kept afterwards as the submission's fileUrl; files of jobs superseded by a
+    resubmission, before or during processing, are deleted.
+    """
+    meta = job.metadata
+    submission_ref = db.collection("classrooms").document(meta["classroom_id"])\
+                       .collection("assignments").document(meta["assignment_id"])\
+                       .collection("submissions").document(meta["student_id"])
+
+    async def superseded():
+        submission = await repo.run(submission_ref.get, field_paths=["ingestionJobId"])
+        if submission.exists and submission.to_dict().get("ingestionJobId") == job.id:
+            return False
+        logger.info(f"Dropping superseded ingestion job {job.id}")
+        await asyncio.to_thread(ingestion_queue.discard, job)
+        return True
+
+    if await superseded():
+        return
+
+    try:
+        await repo.update(submission_ref, {"ingestionStatus": "processing"})
+        upload_handler = await asyncio.to_thread(get_upload_handler)
+        document_id = None
+        if upload_handler is not None:
+            document_id = await asyncio.to_thread(
+                upload_handler.upload_submission,
+                file_path=job.file_path,
+                assignment_id=meta["assignment_id"],
+                student_id=meta["student_id"]
+            )
+        if await superseded():
+            return
+        await repo.update(submission_ref, {
+            "ingestionStatus": "indexed" if document_id else "failed",
+            "ingestionDocId": document_id,
         })
-    
-    batch.commit()
-    
-    return {"status": "success", "submissionId": user_id}
+    except Exception as e:
+        # Never leave the submission stuck in "processing"; if even this write
+        # fails the job is retried on the next start
+        logger.error(f"Ingestion job {job.id} failed: {str(e)}")
+        await repo.update(submission_ref, {"ingestionStatus": "failed"})
+
+ingestion_queue = IngestionQueue(ingest_submission)
 
 @app.post("/api/classrooms/{classroom_id}/assignments/{assignment_id}/grade")
 async def grade_assignment(
@@ -607,12 +893,12 @@ async def grade_assignment(
     user_id: str = Depends(get_user_id)
 ):
     # Verify user is teacher
-    classroom = db.collection("classrooms").document(classroom_id).get()
-    if not classroom.exists or classroom.to_dict()["teacherId"] != user_id:
-        raise HTTPException(status_code=403, detail="Not authorized")
+    await require_member(classroom_id, user_id, teacher_only=True)
     
     if request.useAI:
-        if not model:
+        # Waits for the background warm-up if the model is still loading
+        grading_engine = await asyncio.to_thread(get_grading_engine)
+        if not grading_engine:
             raise HTTPException(
                 status_code=500, 
                 detail="AI grading is not available - model failed to load"
@@ -622,71 +908,27 @@ async def grade_assignment(
             # Get assignment and submissions
             assignment_ref = db.collection("classrooms").document(classroom_id)\
                               .collection("assignments").document(assignment_id)
-            assignment_doc = assignment_ref.get()
-            assignment_data = assignment_doc.to_dict()
-            
             submissions_ref = assignment_ref.collection("submissions")
-            submissions = {doc.id: doc.to_dict() for doc in submissions_ref.stream()}
-            
-            results = {"status": "success", "results": {}}
+            assignment_doc, submission_docs = await asyncio.gather(
+                repo.get(assignment_ref), repo.stream(submissions_ref)
+            )
+            assignment_data = assignment_doc.to_dict()
+            submissions = {doc.id: doc.to_dict() for doc in submission_docs}
             
-            # Grade each submission
-            for student_id, submission in submissions.items():
-                if submission.get("status") != "graded":
-                    answers = submission.get("answers", {})
-                    total_score = 0
-                    feedback = []
-                    
-                    for q_idx, question in enumerate(assignment_data["questions"]):
-                        student_answer = answers.get(str(q_idx), "").strip()
-                        if not student_answer:
-                            continue
-                            
-                        # Calculate similarity score using the model
-                        answer_embedding = model.encode([student_answer])
-                        question_embedding = model.encode([question["question_text"]])
-                        similarity = float(util.pytorch_cos_sim(answer_embedding, question_embedding)[0][0])
-                        
-                        # Convert similarity to score (0-100)
-                        question_score = int(similarity * question["marks"])
-                        total_score += question_score
-                        
-                        feedback.append(f"Q{q_idx + 1}: {question_score}/{question['marks']} - " + 
-                                     ("Good understanding shown." if similarity > 0.8 else 
-                                      "Partial understanding shown." if similarity > 0.5 else 
-                                      "Review this topic."))
-                    
-                    results["results"][student_id] = {
-                        "status": "success",
-                        "student_id": student_id,
-                        "mark": f"{total_score}/100",
-                        "feedback": "\n".join(feedback)
-                    }
+            results = {
+                "status": "success",
+                "results": await asyncio.to_thread(grading_engine.grade, assignment_data["questions"], submissions)
+            }
             
-            # Update submissions with AI grades
-            for submission_id, result in results["results"].items():
-                if result["status"] == "success":
-                    grade = float(result["mark"].split("/")[0])
-                    batch = db.batch()
-                    
-                    # Update main submission status
-                    batch.update(assignment_ref, {
-                        f"submissions.{submission_id}.status": "graded",
-                        f"submissions.{submission_id}.grade": grade,
-                        f"submissions.{submission_id}.feedback": result["feedback"],
-                        f"submissions.{submission_id}.gradedBy": "AI"
-                    })
-                    
-                    # Update submission in subcollection
-                    submission_ref = submissions_ref.document(submission_id)
-                    batch.update(submission_ref, {
-                        "status": "graded",
-                        "grade": grade,
-                        "feedback": result["feedback"],
-                        "gradedBy": "AI"
-                    })
-                    
-                    batch.commit()
+            # Persist all AI grades in as few batched writes as possible
+            await grade_writer.write(assignment_ref, {
+                student_id: {
+                    "grade": float(result["mark"].split("/")[0]),
+                    "feedback": result["feedback"]
+                }
+                for student_id, result in results["results"].items()
+                if result["status"] == "success"
+            }, graded_by="AI")
             
             return results
                     
@@ -697,45 +939,37 @@ async def grade_assignment(
         # Manual review mode - just mark as ready for review
         assignment_ref = db.collection("classrooms").document(classroom_id)\
                         .collection("assignments").document(assignment_id)
-        assignment_data = assignment_ref.get().to_dict()
+        submission_docs = await repo.stream(assignment_ref.collection("submissions").select(["__name__"]))
         results = {
             "status": "success",
             "results": {
-                submission_id: {
+                doc.id: {
                     "status": "pending_review",
-                    "student_id": student_id,
+                    "student_id": doc.id,
                 }
-                for student_id, submission_id in assignment_data.get("submissions", {}).items()
+                for doc in submission_docs
             }
         }
-    
-    # Update grades in Firestore
-    assignment_ref = db.collection("classrooms").document(classroom_id)\
-                      .collection("assignments").document(assignment_id)
-    
-    for submission_id, result in results.get("results", {}).items():
-        if result.get("status") == "success":
-            assignment_ref.set({
-                f"submissions.{result['student_id']}": {
-                    "status": "graded" if request.useAI else "pending_review",
-                    "grade": float(result["mark"].split("/")[0]) if request.useAI else None,
-                    "feedback": result["feedback"] if request.useAI else None,
-                    "gradedBy": "AI" if request.useAI else None
-                }
-            }, merge=True)
-    
-    return results
+        return results
 
 @app.get("/api/classrooms/{classroom_id}/messages")
-async def get_classroom_messages(classroom_id: str, user_id: str = Depends(get_user_id)):
+async def get_classroom_messages(
+    classroom_id: str,
+    response: Response,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    user_id: str = Depends(get_user_id)
+):
+    """Page of classroom messages, newest first, with the same cursors as /messages/{chat_id}"""
     classroom_ref = db.collection("classrooms").document(classroom_id)
-    messages_ref = classroom_ref.collection("chats").order_by("timestamp", direction=firestore.Query.DESCENDING).limit(100)
-    
-    messages = []
-    for doc in messages_ref.stream():
-        messages.append(doc.to_dict())
-    
-    return messages
+    try:
+        page = await fetch_page(repo, classroom_ref.collection("chats"), limit=limit,
+                                before=before, after=after, newest_first=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers.update(page.headers())
+    return page.items
 
 @app.post("/api/classrooms/{classroom_id}/messages")
 async def send_classroom_message(
@@ -753,7 +987,7 @@ async def send_classroom_message(
         "type": "user"
     }
     
-    message_ref.set(message_data)
+    await repo.set(message_ref, message_data)
     return message_data
 
 def convert_timestamp(obj):
@@ -770,31 +1004,32 @@ async def create_classroom(
     user_id: str = Depends(get_user_id)
 ):
     # Verify user is a teacher
-    user_doc = db.collection("users").document(user_id).get()
+    user_doc = await repo.get(db.collection("users").document(user_id))
     if not user_doc.exists or user_doc.to_dict()["role"] != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can create classrooms")
     
-    # Create classroom with unique join code
-    code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+    # Create classroom with a join code reserved in the registry, so it is unique
     classroom_ref = db.collection("classrooms").document()
+    code = await join_codes.allocate(classroom_ref.id)
     classroom_data = {
         "name": request.name,
         "description": request.description,
         "teacherId": user_id,
         "joinCode": code,
         "createdAt": firestore.SERVER_TIMESTAMP,
-        "students": {}
+        "students": {}  # Legacy roster; members now live in the members subcollection
     }
     
-    classroom_ref.set(classroom_data)
+    await repo.set(classroom_ref, classroom_data)
+    await memberships.add(classroom_ref.id, user_id, TEACHER)
     
     # Add classroom to teacher's list
-    db.collection("users").document(user_id).update({
+    await repo.update(db.collection("users").document(user_id), {
         "teachingClassrooms": firestore.ArrayUnion([classroom_ref.id])
     })
     
     # Get the created classroom data
-    created_classroom = classroom_ref.get()
+    created_classroom = await repo.get(classroom_ref)
     response_data = {
         "id": classroom_ref.id,
         **convert_timestamp(created_classroom.to_dict() or {})
@@ -807,45 +1042,50 @@ async def join_classroom(
     request: JoinClassroomRequest,
     user_id: str = Depends(get_user_id)
 ):
-    # Find classroom by join code
-    classrooms = db.collection("classrooms")\
-                   .where("joinCode", "==", request.code)\
-                   .limit(1)\
-                   .stream()
-    
-    classroom = next((doc for doc in classrooms), None)
-    if not classroom:
+    # Find classroom by join code (a point read on the registry)
+    classroom_id = await join_codes.resolve(request.code)
+    if not classroom_id:
         raise HTTPException(status_code=404, detail="Invalid classroom code")
     
-    classroom_id = classroom.id
+    try:
+        classroom, role, user_data = await asyncio.gather(
+            repo.get(db.collection("classrooms").document(classroom_id)),
+            memberships.role(classroom_id, user_id),
+            user_loader.load(user_id),
+        )
+    except ClassroomNotFound:
+        # The code outlived its classroom
+        raise HTTPException(status_code=404, detail="Invalid classroom code")
+    if not classroom.exists:
+        raise HTTPException(status_code=404, detail="Invalid classroom code")
     classroom_data = classroom.to_dict()
     
     # Check if user is already in classroom
-    if user_id in classroom_data.get("students", {}):
+    if role is not None:
         raise HTTPException(status_code=400, detail="Already enrolled in this classroom")
     
     # Get user data
-    user = db.collection("users").document(user_id).get()
-    if not user.exists:
+    if user_data is None:
         raise HTTPException(status_code=404, detail="User not found")
-    user_data = user.to_dict()
     
-    # Add student to classroom
-    db.collection("classrooms").document(classroom_id).update({
-        f"students.{user_id}": {
-            "joinedAt": firestore.SERVER_TIMESTAMP,
-            "name": user_data["name"],
-            "email": user_data["email"]
-        }
-    })
+    # Add student to the classroom's members subcollection, keeping the classroom document small
+    await memberships.add(classroom_id, user_id, STUDENT, user_data)
     
     # Add classroom to student's enrolled list
-    db.collection("users").document(user_id).update({
+    await repo.update(db.collection("users").document(user_id), {
         "enrolledClassrooms": firestore.ArrayUnion([classroom_id])
     })
     
     return {"id": classroom_id, **classroom_data}
 
+@app.post("/api/classrooms/{classroom_id}/join-code/rotate")
+async def rotate_join_code(classroom_id: str, user_id: str = Depends(get_user_id)):
+    """Issue a new join code for the classroom; the old code stops working immediately"""
+    await require_member(classroom_id, user_id, teacher_only=True)
+    classroom = await repo.run(db.collection("classrooms").document(classroom_id).get, field_paths=["joinCode"])
+    code = await join_codes.rotate(classroom_id, (classroom.to_dict() or {}).get("joinCode"))
+    return {"id": classroom_id, "joinCode": code}
+
 @app.get("/api/submissions/{assignment_id}")
 async def get_submissions(
     assignment_id: str,
@@ -853,31 +1093,28 @@ async def get_submissions(
     user_id: str = Depends(get_user_id)
 ):
     try:
-        # Get classroom and verify teacher access
+        # Verify teacher access
         classroom_ref = db.collection("classrooms").document(classroom_id)
-        classroom = classroom_ref.get()
-        if not classroom.exists:
-            raise HTTPException(status_code=404, detail="Classroom not found")
-        
-        if classroom.to_dict()["teacherId"] != user_id:
-            raise HTTPException(status_code=403, detail="Only teachers can view all submissions")
+        await require_member(classroom_id, user_id, teacher_only=True,
+                             detail="Only teachers can view all submissions")
 
-        # Get assignment submissions
+        # Get assignment submissions from the subcollection, the source of truth
         assignment_ref = classroom_ref.collection("assignments").document(assignment_id)
-        assignment_doc = assignment_ref.get()
+        assignment_doc, submission_docs = await asyncio.gather(
+            repo.get(assignment_ref), repo.stream(assignment_ref.collection("submissions"))
+        )
         
         if not assignment_doc.exists:
             raise HTTPException(status_code=404, detail="Assignment not found")
         
-        assignment_data = assignment_doc.to_dict()
-        submissions = assignment_data.get("submissions", {})
+        submissions = {doc.id: doc.to_dict() for doc in submission_docs}
         
-        # Format submissions with student details
+        # Format submissions with student details, loading every profile in one batch
+        students = await user_loader.load_many(submissions.keys())
         formatted_submissions = []
         for student_id, submission in submissions.items():
-            student_ref = db.collection("users").document(student_id).get()
-            if student_ref.exists:
-                student_data = student_ref.to_dict()
+            student_data = students.get(student_id)
+            if student_data is not None:
                 formatted_submissions.append({
                     "id": student_id,
                     "student_name": student_data.get("name", "Unknown"),
@@ -896,49 +1133,58 @@ async def get_submissions(
         logger.error(f"Error fetching submissions: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Check an If-None-Match header (possibly a list, weak, or "*") against an ETag"""
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(
+        tag == "*" or tag.removeprefix("W/").strip('"') == etag
+        for tag in candidates
+    )
+
 @app.get("/api/download-assignment-pdf")
 async def download_assignment_pdf(
     assignment_id: str,
     include_answers: bool = False,
-    user_id: str = Depends(get_user_id)
+    if_none_match: Optional[str] = Header(None),
+    user_id: str = Depends(get_user_id),
+    generator: AssignmentGenerator = Depends(get_assignment_generator)
 ):
-    """Download assignment as PDF"""
+    """Download assignment as PDF, served from the rendered-PDF cache with ETag revalidation"""
     try:
         # Get assignment data from Firestore
         assignment_ref = db.collection("assignments").document(assignment_id)
-        assignment_doc = assignment_ref.get()
+        assignment_doc = await repo.get(assignment_ref)
         
         if not assignment_doc.exists:
             raise HTTPException(status_code=404, detail="Assignment not found")
             
         assignment_data = assignment_doc.to_dict()
         
-        # Check permissions
-        classroom_ref = db.collection("classrooms").document(assignment_data["classroom_id"])
-        classroom_doc = classroom_ref.get()
-        classroom_data = classroom_doc.to_dict()
+        # Check permissions: only teachers can see answers
+        await require_member(assignment_data["classroom_id"], user_id,
+                             teacher_only=include_answers, detail="Not authorized to view answers")
         
-        if not classroom_data:
-            raise HTTPException(status_code=404, detail="Classroom not found")
-            
-        # Only teachers can see answers
-        if include_answers and classroom_data["teacherId"] != user_id:
-            raise HTTPException(status_code=403, detail="Not authorized to view answers")
-        
-        # Generate PDF using the AssignmentGenerator
-        generator = AssignmentGenerator()
-        pdf_path = generator.create_pdf(assignment_data, include_answers)
+        # The ETag changes whenever the assignment content does
+        etag = pdf_cache.etag_for(assignment_id, assignment_data, include_answers)
+        cache_headers = {"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"}
+        if if_none_match and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers)
+
+        # Render once per assignment version, then serve the cached bytes
+        pdf_content = await pdf_cache.get_or_render(
+            etag, lambda: generator.create_pdf(assignment_data, include_answers)
+        )
         
-        if not pdf_path:
+        if not pdf_content:
             raise HTTPException(status_code=500, detail="Failed to generate PDF")
         
         # Create descriptive filename
         filename = f"{assignment_data['title'].replace(' ', '_')}_{assignment_id}.pdf"
         
-        return FileResponse(
-            path=pdf_path,
+        return StreamingResponse(
+            io.BytesIO(pdf_content),
             media_type="application/pdf",
-            filename=filename
+            headers={"Content-Disposition": f'attachment; filename="{filename}"', **cache_headers}
         )
     except Exception as e:
         logger.error(f"Error generating PDF: {str(e)}")
@@ -953,22 +1199,14 @@ async def get_assignment(
     # Get the assignment document
     assignment_ref = db.collection("classrooms").document(classroom_id)\
                       .collection("assignments").document(assignment_id)
-    assignment_doc = assignment_ref.get()
+    # Verify user has access (is teacher or enrolled student) while the assignment loads
+    _, assignment_doc = await asyncio.gather(
+        require_member(classroom_id, user_id), repo.get(assignment_ref)
+    )
 
     if not assignment_doc.exists:
         raise HTTPException(status_code=404, detail="Assignment not found")
 
-    # Get classroom to verify access
-    classroom = db.collection("classrooms").document(classroom_id).get()
-    if not classroom.exists:
-        raise HTTPException(status_code=404, detail="Classroom not found")
-
-    classroom_data = classroom.to_dict()
-    # Verify user has access (is teacher or enrolled student)
-    if (classroom_data["teacherId"] != user_id and 
-        user_id not in classroom_data.get("students", {})):
-        raise HTTPException(status_code=403, detail="Not authorized")
-
     return {
         "id": assignment_id,
         "classroomId": classroom_id,
@@ -985,35 +1223,15 @@ async def grade_submission(
 ):
     try:
         # Verify teacher access
-        classroom = db.collection("classrooms").document(classroom_id).get()
-        if not classroom.exists or classroom.to_dict()["teacherId"] != user_id:
-            raise HTTPException(status_code=403, detail="Only teachers can grade submissions")
+        await require_member(classroom_id, user_id, teacher_only=True,
+                             detail="Only teachers can grade submissions")
 
-        # Update submission grade
+        # Update submission grade in the assignment summary and the subcollection
         assignment_ref = db.collection("classrooms").document(classroom_id)\
                           .collection("assignments").document(assignment_id)
-        submission_ref = assignment_ref.collection("submissions").document(student_id)
-
-        # Update both submission locations (main document and subcollection)
-        batch = db.batch()
-        
-        # Update main submission status
-        batch.update(assignment_ref, {
-            f"submissions.{student_id}.status": "graded",
-            f"submissions.{student_id}.grade": grade_data["grade"],
-            f"submissions.{student_id}.feedback": grade_data["feedback"],
-            f"submissions.{student_id}.gradedBy": "teacher"
-        })
-
-        # Update detailed submission
-        batch.update(submission_ref, {
-            "status": "graded",
-            "grade": grade_data["grade"],
-            "feedback": grade_data["feedback"],
-            "gradedBy": "teacher"
-        })
-
-        batch.commit()
+        await grade_writer.write(assignment_ref, {
+            student_id: {"grade": grade_data["grade"], "feedback": grade_data["feedback"]}
+        }, graded_by="teacher")
         return {"status": "success"}
     except Exception as e:
         logger.error(f"Error grading submission: {str(e)}")
@@ -1028,16 +1246,9 @@ async def get_submission_details(
 ):
     """Get detailed submission information for a specific student"""
     try:
-        # Verify classroom access
-        classroom = db.collection("classrooms").document(classroom_id).get()
-        if not classroom.exists:
-            raise HTTPException(status_code=404, detail="Classroom not found")
-        
-        classroom_data = classroom.to_dict()
-        is_teacher = classroom_data["teacherId"] == user_id
-        
         # Only allow teachers or the submission owner to view
-        if not (is_teacher or user_id == student_id):
+        role = await require_member(classroom_id, user_id, detail="Not authorized to view this submission")
+        if role != TEACHER and user_id != student_id:
             raise HTTPException(status_code=403, detail="Not authorized to view this submission")
 
         # Get assignment and submission
@@ -1045,16 +1256,14 @@ async def get_submission_details(
                           .collection("assignments").document(assignment_id)
         submission_ref = assignment_ref.collection("submissions").document(student_id)
         
-        submission_doc = submission_ref.get()
+        submission_doc = await repo.get(submission_ref)
         if not submission_doc.exists:
             raise HTTPException(status_code=404, detail="Submission not found")
         
         submission_data = submission_doc.to_dict()
 
         # Get student details
-        student_ref = db.collection("users").document(student_id)
-        student_doc = student_ref.get()
-        student_data = student_doc.to_dict() if student_doc.exists else {}
+        student_data = await user_loader.load(student_id) or {}
 
         # Combine submission data with student info
         return {
@@ -0,0 +1,147 @@
+"""
+Cross-check and benchmark the embedding backends on a fixed corpus.
+
+Each backend (see embedding_backend.py) is loaded in its own process so load
+time and peak memory are measured cleanly:
+
+    python benchmarks/embedding_backends.py --backends torch onnx onnx-int8
+
+Every non-torch backend is compared to the PyTorch embeddings sentence by
+sentence; the script exits non-zero if any cosine similarity falls below
+--tolerance, so it can gate switching EMBEDDING_BACKEND on a host.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Question/answer-style sentences similar to what grading and ingestion embed
+CORPUS = [
+    "Explain the causes of the First World War.",
+    "Militarism, alliances, imperialism and nationalism all raised tensions in Europe.",
+    "The assassination of Archduke Franz Ferdinand triggered the conflict.",
+    "Describe the process of photosynthesis.",
+    "Plants convert light energy, water and carbon dioxide into glucose and oxygen.",
+    "Chlorophyll in the chloroplasts absorbs mostly red and blue light.",
+    "What is Newton's second law of motion?",
+    "Force equals mass times acceleration.",
+    "An object accelerates in the direction of the net force acting on it.",
+    "Define a prime number and give three examples.",
+    "A prime has exactly two divisors, one and itself, for example 2, 3 and 5.",
+    "Why is the sky blue?",
+    "Shorter wavelengths of sunlight are scattered more by air molecules.",
+    "Summarize the main themes of Romeo and Juliet.",
+    "Love, fate and the conflict between families drive the tragedy.",
+    "What does the mitochondria do in a cell?",
+    "It produces most of the cell's ATP through cellular respiration.",
+    "Compare democracy and monarchy as systems of government.",
+    "In a democracy citizens elect leaders, while a monarch usually inherits power.",
+    "How does supply and demand determine price?",
+    "Prices rise when demand exceeds supply and fall when supply exceeds demand.",
+    "I don't know.",
+    "",
+    "The water cycle includes evaporation, condensation, precipitation and collection.",
+    "Explain the difference between weather and climate.",
+    "Weather is short term conditions, climate is the long term average of a region.",
+    "Write a function that reverses a string.",
+    "Iterate from the last character to the first and append each to a new string.",
+    "What were the consequences of the Industrial Revolution?",
+    "Urbanization, factory work, new technology and pollution all increased.",
+    "Solve for x: 2x + 6 = 14.",
+    "Subtract six from both sides and divide by two, so x equals four.",
+]
+
+
+def worker(backend, out_path, repeats):
+    import numpy as np
+
+    from embedding_backend import load_embedding_model, loaded_backend
+    from registry import EMBEDDING_MODEL_NAME
+
+    start = time.perf_counter()
+    # Never fall back here: a silent torch load would cross-check torch against itself
+    model = load_embedding_model(EMBEDDING_MODEL_NAME, backend, fallback=False)
+    load_seconds = time.perf_counter() - start
+    if loaded_backend(model) != backend:
+        sys.exit(f"Requested the {backend} backend but loaded {loaded_backend(model)}")
+
+    embeddings = model.encode(CORPUS, batch_size=64, convert_to_numpy=True, show_progress_bar=False)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model.encode(CORPUS, batch_size=64, convert_to_numpy=True, show_progress_bar=False)
+    encode_seconds = time.perf_counter() - start
+
+    np.save(out_path, embeddings)
+    print(json.dumps({
+        "backend": loaded_backend(model),
+        "load_seconds": load_seconds,
+        "sentences_per_second": len(CORPUS) * repeats / encode_seconds,
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def row_cosines(a, b):
+    import numpy as np
+
+    a = a / np.linalg.norm(a, axis=1, keepdims=True).clip(min=1e-12)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True).clip(min=1e-12)
+    return (a * b).sum(axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--repeats", type=int, default=20, help="timed passes over the corpus")
+    parser.add_argument("--tolerance", type=float, default=0.99, help="minimum cosine vs. torch per sentence")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker, args.out, args.repeats)
+        return
+
+    import numpy as np
+
+    backends = ["torch"] + [b for b in args.backends if b != "torch"]
+    results, embeddings = {}, {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in backends:
+            out_path = os.path.join(tmp, f"{backend}.npy")
+            run = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", backend, "--out", out_path,
+                 "--repeats", str(args.repeats)],
+                capture_output=True, text=True,
+            )
+            if run.returncode != 0:
+                sys.exit(f"The {backend} backend failed to load:\n{run.stderr.strip()}")
+            results[backend] = json.loads(run.stdout.strip().splitlines()[-1])
+            if results[backend]["backend"] != backend:
+                sys.exit(f"Requested the {backend} backend but the worker ran {results[backend]['backend']}")
+            embeddings[backend] = np.load(out_path)
+
+    failed = False
+    print(f"{'backend':<10} {'load s':>7} {'sent/s':>9} {'peak MB':>8} {'min cos':>8} {'mean cos':>9}")
+    for backend in backends:
+        r = results[backend]
+        cosines = row_cosines(embeddings[backend], embeddings["torch"])
+        print(f"{backend:<10} {r['load_seconds']:>7.2f} {r['sentences_per_second']:>9.1f} "
+              f"{r['peak_rss_mb']:>8.0f} {cosines.min():>8.4f} {cosines.mean():>9.4f}")
+        if cosines.min() < args.tolerance:
+            failed = True
+            worst = int(cosines.argmin())
+            print(f"  {backend} drifts from torch on {CORPUS[worst]!r} (cosine {cosines[worst]:.4f})")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
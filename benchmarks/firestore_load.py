@@ -0,0 +1,96 @@
+"""
+Load benchmark for the Firestore data-access layer.
+
+Runs against the Firestore emulator, so start it first:
+
+    gcloud emulators firestore start --host-port=localhost:8080
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python benchmarks/firestore_load.py
+
+Two apps serve the same `/messages/{chat_id}` read:
+  - "blocking": the pre-repository handler, calling the sync client on the event loop
+  - "offloaded": the real route in app.py, which goes through FirestoreRepository
+
+Both are driven in-process over ASGI with the same number of concurrent requests,
+and the p50/p95/p99 latencies are printed side by side.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+    sys.exit("FIRESTORE_EMULATOR_HOST is not set; refusing to benchmark against a real project")
+
+import httpx
+from fastapi import FastAPI
+
+from app import app as offloaded_app, db
+
+CHAT_ID = "bench-chat"
+
+
+def seed(message_count):
+    messages_ref = db.collection("chats").document(CHAT_ID).collection("messages")
+    batch = db.batch()
+    for i in range(message_count):
+        batch.set(messages_ref.document(f"m{i:04d}"), {
+            "senderId": "bench",
+            "text": f"message {i}",
+            "timestamp": i,
+            "chatId": CHAT_ID,
+        })
+    batch.commit()
+
+
+def build_blocking_app():
+    blocking_app = FastAPI()
+
+    @blocking_app.get("/messages/{chat_id}")
+    async def get_messages(chat_id: str):
+        messages_ref = db.collection("chats").document(chat_id).collection("messages").order_by("timestamp")
+        return [doc.to_dict() for doc in messages_ref.stream()]
+
+    return blocking_app
+
+
+async def run_load(asgi_app, concurrency, rounds):
+    transport = httpx.ASGITransport(app=asgi_app)
+    latencies = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one():
+            start = time.perf_counter()
+            response = await client.get(f"/messages/{CHAT_ID}")
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+        for _ in range(rounds):
+            await asyncio.gather(*(one() for _ in range(concurrency)))
+    return latencies
+
+
+def summarize(name, latencies):
+    ordered = sorted(latencies)
+    pct = lambda p: ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+    print(f"{name:>10}: n={len(ordered)} mean={statistics.mean(ordered) * 1000:.1f}ms "
+          f"p50={pct(0.50):.1f}ms p95={pct(0.95):.1f}ms p99={pct(0.99):.1f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--messages", type=int, default=50)
+    args = parser.parse_args()
+
+    seed(args.messages)
+    print(f"{args.concurrency} concurrent requests x {args.rounds} rounds, {args.messages} messages per chat")
+    summarize("blocking", await run_load(build_blocking_app(), args.concurrency, args.rounds))
+    summarize("offloaded", await run_load(offloaded_app, args.concurrency, args.rounds))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+"""
+Cold-start benchmark: time from launching uvicorn to the first 200 responses.
+
+Starts the app in a fresh process (so nothing is already imported or cached)
+and polls it until it answers, several times in a row:
+
+    python benchmarks/startup_time.py --runs 3
+
+For each run it reports the time to the first 200 from `/health` (liveness,
+what the Railway health check waits for) and from `/health/ready` (models
+loaded). Uses the same environment as the server, so Firebase credentials
+and GEMINI_API must be available.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def status_of(url):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return None
+
+
+def one_run(app, timeout):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+    )
+    live = ready = None
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited with code {server.returncode}")
+            if live is None and status_of(f"{base}/health") == 200:
+                live = time.perf_counter() - start
+            if live is not None and status_of(f"{base}/health/ready") == 200:
+                ready = time.perf_counter() - start
+                break
+            time.sleep(0.05)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    return live, ready
+
+
+def summarize(label, values):
+    values = [v for v in values if v is not None]
+    if not values:
+        print(f"  {label}: never")
+        return
+    print(f"  {label}: median {statistics.median(values):.2f}s, min {min(values):.2f}s, max {max(values):.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--app", default="app:app")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for readiness per run")
+    args = parser.parse_args()
+
+    lives, readies = [], []
+    for run in range(args.runs):
+        live, ready = one_run(args.app, args.timeout)
+        print(f"run {run + 1}: live {live if live is None else f'{live:.2f}s'}, "
+              f"ready {ready if ready is None else f'{ready:.2f}s'}")
+        lives.append(live)
+        readies.append(ready)
+
+    print(f"{args.app}, {args.runs} cold starts")
+    summarize("first 200 from /health      ", lives)
+    summarize("first 200 from /health/ready", readies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Wall-clock benchmark for the visual summary section pipeline.
+
+Gemini and Cloudinary are replaced with stubs that sleep for a fixed latency,
+so no API keys or network are needed:
+
+    python benchmarks/visual_summary_pipeline.py --sections 5 --latency 0.5
+
+Each section costs three stubbed round trips (image prompt, image stream,
+upload). The pipeline is timed once with one section at a time, which matches
+the old serial loop, and once with the configured section concurrency.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cloudinary.uploader
+
+import visual_summary
+
+
+class StubGeminiClient:
+    def __init__(self, sections, latency):
+        self.sections = sections
+        self.latency = latency
+
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self.latency)
+        if "Visual Summary" in contents:
+            summary = {
+                "type": "summary",
+                "title": "Benchmark",
+                "sections": [
+                    {"title": f"Section {i}", "text": f"Text {i}", "imageUrl": "", "audioUrl": ""}
+                    for i in range(self.sections)
+                ],
+            }
+            return SimpleNamespace(text=json.dumps(summary))
+        return SimpleNamespace(text="an image prompt")
+
+    async def generate_content_stream(self, model, contents, config=None):
+        await asyncio.sleep(self.latency)
+        inline_data = SimpleNamespace(mime_type="image/png", data=b"\x89PNG" + b"\0" * 1024)
+        part = SimpleNamespace(inline_data=inline_data)
+        yield SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+
+async def timed_run(concurrency):
+    visual_summary.SECTION_CONCURRENCY = concurrency
+    start = time.perf_counter()
+    summary = await visual_summary.generate_visual_summary_json("Benchmark", "")
+    elapsed = time.perf_counter() - start
+    assert all(section["imageUrl"] for section in summary["sections"])
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sections", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per stubbed round trip")
+    args = parser.parse_args()
+
+    stub = StubGeminiClient(args.sections, args.latency)
+    visual_summary.get_client = lambda: stub
+
+    def stub_upload(file, **options):
+        time.sleep(args.latency)
+        return {"secure_url": "https://example.invalid/image.png"}
+
+    cloudinary.uploader.upload = stub_upload
+
+    concurrency = visual_summary.SECTION_CONCURRENCY
+    serial = await timed_run(1)
+    parallel = await timed_run(concurrency)
+    one_section = 4 * args.latency  # skeleton + prompt + image + upload
+    print(f"{args.sections} sections, {args.latency:.2f}s per round trip")
+    print(f"  serial:   {serial:.2f}s")
+    print(f"  parallel: {parallel:.2f}s (one section alone is ~{one_section:.2f}s)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
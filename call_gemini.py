@@ -1,14 +1,23 @@
-from google import genai
-import json
-from dotenv import load_dotenv
-import os
-load_dotenv()
-
-def generate_response(prompt):
-    client = genai.Client(api_key=os.getenv("GEMINI_API"))
-    response = client.models.generate_content(
-        model="gemini-2.0-flash-lite",
+from contextlib import aclosing
+
+from gemini_client import get_client
+
+CHAT_MODEL = "gemini-2.0-flash-lite"
+
+async def generate_response(prompt):
+    response = await get_client().generate_content(
+        model=CHAT_MODEL,
         contents=prompt,
     )
 
     return response
+
+async def stream_response(prompt):
+    """Yield the response text piece by piece as Gemini produces it."""
+    async with aclosing(get_client().generate_content_stream(
+        model=CHAT_MODEL,
+        contents=prompt,
+    )) as stream:
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Tuple
+
+from firebase_admin import firestore
+
+from call_gemini import generate_response
+
+logger = logging.getLogger(__name__)
+
+# Most recent messages sent verbatim to the model
+CHAT_MEMORY_WINDOW = int(os.getenv("CHAT_MEMORY_WINDOW", "10"))
+# Rough token budget for summary + history (the new user message is always sent)
+CHAT_MEMORY_TOKEN_BUDGET = int(os.getenv("CHAT_MEMORY_TOKEN_BUDGET", "2000"))
+# Fold older messages into the summary once this many have left the window
+CHAT_SUMMARY_BATCH = int(os.getenv("CHAT_SUMMARY_BATCH", "6"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token), good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+@dataclass
+class Turn:
+    id: str
+    role: str
+    text: str
+    timestamp: Any
+
+    @property
+    def position(self):
+        return (self.timestamp, self.id)
+
+    def render(self) -> str:
+        return f"{self.role}: {self.text}"
+
+
+@dataclass
+class MemoryContext:
+    summary: str = ""
+    turns: List[Turn] = field(default_factory=list)    # inside the window, oldest first
+    pending: List[Turn] = field(default_factory=list)  # left the window, not yet summarized
+    user_id: str = ""
+    summarized_through: Optional[Tuple[Any, str]] = None
+    # Unsummarized messages may exist beyond what was fetched (e.g. chats that
+    # predate the summary), so the next summary pass must page through them
+    backfill: bool = False
+
+
+class ChatMemory:
+    """
+    Rolling-window conversation memory for `chat_with_memory`.
+
+    The newest CHAT_MEMORY_WINDOW messages are sent verbatim; anything older is
+    represented by a running summary stored on the chat document under
+    `memory` (`summary`, `summarizedThrough`, `summarizedThroughId`). The chat
+    document and the newest messages are read concurrently, so each request
+    costs one round trip regardless of chat length. Messages that have slid
+    out of the window are still sent verbatim until CHAT_SUMMARY_BATCH of them
+    have accumulated and been folded into the summary in the background; the
+    prompt is trimmed to CHAT_MEMORY_TOKEN_BUDGET, oldest messages first.
+    Chats with older unsummarized history (those that predate the summary)
+    are summarized once from the start, a page at a time.
+    """
+
+    def __init__(self, repo, window=None, token_budget=None, summary_batch=None):
+        self.repo = repo
+        self.window = window or CHAT_MEMORY_WINDOW
+        self.token_budget = token_budget or CHAT_MEMORY_TOKEN_BUDGET
+        self.summary_batch = summary_batch or CHAT_SUMMARY_BATCH
+        self._summarizing = set()
+        self._tasks = set()
+
+    @staticmethod
+    def _turn(doc, user_id: str) -> Optional[Turn]:
+        data = doc.to_dict()
+        if data.get("timestamp") is None or not data.get("text"):
+            return None
+        role = "User" if data.get("senderId") == user_id else "Assistant"
+        return Turn(doc.id, role, data["text"], data["timestamp"])
+
+    async def load(self, chat_ref, user_id: str) -> MemoryContext:
+        # Over-fetch so messages that just left the window can still be summarized
+        limit = self.window + 2 * self.summary_batch
+        query = (
+            chat_ref.collection("messages")
+            .order_by("timestamp", direction=firestore.Query.DESCENDING)
+            .order_by("__name__", direction=firestore.Query.DESCENDING)
+            .limit(limit)
+        )
+        chat_doc, docs = await asyncio.gather(self.repo.get(chat_ref), self.repo.stream(query))
+
+        memory = (chat_doc.to_dict() or {}).get("memory", {}) if chat_doc.exists else {}
+        summarized_through = None
+        if memory.get("summarizedThrough") is not None:
+            summarized_through = (memory["summarizedThrough"], memory.get("summarizedThroughId", ""))
+
+        turns = [turn for turn in (self._turn(doc, user_id) for doc in reversed(docs)) if turn]
+
+        older, recent = turns[:-self.window], turns[-self.window:]
+        pending = [t for t in older if summarized_through is None or t.position > summarized_through]
+
+        backfill = False
+        if len(docs) == limit and recent:
+            # The oldest fetched message is still unsummarized, so there may be more before it
+            oldest = docs[-1]
+            position = (oldest.get("timestamp"), oldest.id)
+            backfill = summarized_through is None or position > summarized_through
+
+        return MemoryContext(
+            summary=memory.get("summary", ""),
+            turns=recent,
+            pending=pending,
+            user_id=user_id,
+            summarized_through=summarized_through,
+            backfill=backfill,
+        )
+
+    def build_prompt(self, context: MemoryContext, user_message: str) -> str:
+        budget = self.token_budget
+        summary = context.summary
+        if summary:
+            # Never let the summary eat more than a quarter of the budget
+            max_chars = (budget // 4) * 4
+            summary = summary[-max_chars:]
+            budget -= estimate_tokens(summary)
+
+        # Unsummarized messages that left the window come first, so they are
+        # the first to go when the budget is tight
+        history = []
+        for turn in reversed(context.pending + context.turns):
+            line = turn.render()
+            cost = estimate_tokens(line)
+            if cost > budget:
+                break
+            history.append(line)
+            budget -= cost
+        history.reverse()
+
+        parts = []
+        if summary:
+            parts.append(f"Summary of the earlier conversation:\n{summary}\n")
+        parts.extend(history)
+        parts.append(f"User: {user_message}\nAssistant:")
+        return "\n".join(parts)
+
+    def maybe_summarize(self, chat_ref, context: MemoryContext):
+        """Fold messages that left the window into the running summary, off the request path."""
+        if chat_ref.id in self._summarizing:
+            return
+        if context.backfill:
+            work = self._backfill(chat_ref, context)
+        elif len(context.pending) >= self.summary_batch:
+            work = self._summarize(chat_ref, context.summary, list(context.pending))
+        else:
+            return
+        self._summarizing.add(chat_ref.id)
+        task = asyncio.create_task(work)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fold(self, summary: str, turns: List[Turn]) -> str:
+        transcript = "\n".join(turn.render() for turn in turns)
+        prompt = f"""
+        Update the running summary of a tutoring conversation with the new messages below.
+        Keep facts, decisions, open questions and the student's goals; drop small talk.
+        Reply with the updated summary only, in at most {self.token_budget * 3 // 16} words.
+
+        Current summary:
+        {summary or "(empty)"}
+
+        New messages:
+        {transcript}
+        """
+        response = await generate_response(prompt)
+        return response.text.strip()
+
+    async def _save(self, chat_ref, summary: str, last: Turn):
+        await self.repo.update(chat_ref, {
+            "memory.summary": summary,
+            "memory.summarizedThrough": last.timestamp,
+            "memory.summarizedThroughId": last.id,
+        })
+
+    async def _summarize(self, chat_ref, summary: str, pending: List[Turn]):
+        try:
+            summary = await self._fold(summary, pending)
+            await self._save(chat_ref, summary, pending[-1])
+        except Exception as e:
+            logger.warning(f"Failed to update chat summary for {chat_ref.id}: {str(e)}")
+        finally:
+            self._summarizing.discard(chat_ref.id)
+
+    async def _backfill(self, chat_ref, context: MemoryContext):
+        """Summarize everything older than the window, oldest first, saving after each batch."""
+        messages = chat_ref.collection("messages")
+        base = (
+            messages.order_by("timestamp").order_by("__name__")
+            .end_before({"timestamp": context.turns[0].timestamp, "__name__": messages.document(context.turns[0].id)})
+        )
+        cursor = context.summarized_through
+        summary = context.summary
+        page_size = 4 * self.summary_batch * self.window
+        try:
+            while True:
+                query = base
+                if cursor is not None:
+                    query = query.start_after({"timestamp": cursor[0], "__name__": messages.document(cursor[1])})
+                docs = await self.repo.stream(query.limit(page_size))
+                if not docs:
+                    break
+                turns = [turn for turn in (self._turn(doc, context.user_id) for doc in docs) if turn]
+                # Keep each summary call within the token budget
+                batch, cost = [], 0
+                for turn in turns:
+                    batch.append(turn)
+                    cost += estimate_tokens(turn.render())
+                    if cost >= self.token_budget:
+                        summary = await self._fold(summary, batch)
+                        await self._save(chat_ref, summary, batch[-1])
+                        batch, cost = [], 0
+                if batch:
+                    summary = await self._fold(summary, batch)
+                    await self._save(chat_ref, summary, batch[-1])
+                last = docs[-1]
+                cursor = (last.get("timestamp"), last.id)
+                if len(docs) < page_size:
+                    break
+            logger.info(f"Backfilled chat summary for {chat_ref.id}")
+        except Exception as e:
+            logger.warning(f"Failed to backfill chat summary for {chat_ref.id}: {str(e)}")
+        finally:
+            self._summarizing.discard(chat_ref.id)
@@ -0,0 +1,50 @@
+import os
+
+# Window and overlap in model tokens. MiniLM truncates at 256 word pieces,
+# two of which are the [CLS]/[SEP] special tokens.
+CHUNK_TOKENS = int(os.getenv("EMBEDDING_CHUNK_TOKENS", "200"))
+CHUNK_OVERLAP = int(os.getenv("EMBEDDING_CHUNK_OVERLAP", "40"))
+
+
+def _windows(length, size, overlap):
+    step = max(1, size - overlap)
+    start = 0
+    while True:
+        end = min(start + size, length)
+        yield start, end
+        if end == length:
+            return
+        start += step
+
+
+def chunk_text(text, model=None, max_tokens=None, overlap=None):
+    """
+    Split `text` into overlapping windows that each fit the embedding model.
+
+    Windows are measured with the model's own tokenizer when it can report
+    character offsets, so every chunk is embedded in full, and each chunk is
+    an exact slice of the original text. Without a usable tokenizer the text
+    is split on whitespace at roughly 0.75 words per token.
+
+    Returns a list of chunk strings (empty if the text has no content).
+    """
+    if not text or not text.strip():
+        return []
+    max_tokens = max_tokens or CHUNK_TOKENS
+    overlap = CHUNK_OVERLAP if overlap is None else overlap
+
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is not None and getattr(tokenizer, "is_fast", False):
+        seq_limit = getattr(model, "max_seq_length", None)
+        if seq_limit:
+            max_tokens = min(max_tokens, seq_limit - 2)
+        offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+        if offsets:
+            return [
+                text[offsets[start][0]:offsets[end - 1][1]]
+                for start, end in _windows(len(offsets), max_tokens, overlap)
+            ]
+
+    words = text.split()
+    size = max(1, int(max_tokens * 0.75))
+    return [" ".join(words[start:end]) for start, end in _windows(len(words), size, int(overlap * 0.75))]
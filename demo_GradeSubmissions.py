@@ -1,15 +1,9 @@
-import google.generativeai as genai
-import PyPDF2, os, tempfile, random
-from dotenv import load_dotenv
+import PyPDF2, tempfile, random
 from typing import List, Dict
-import firebase_admin
-from firebase_admin import credentials, firestore
-import chromadb, re, json
-from sentence_transformers import SentenceTransformer
+from firebase_admin import firestore
+import re, json
 import numpy as np
-import base64
-# Import the ChromaDB path from uplaod_assignment.py
-from demo_uploadAssignment import CHROMA_DB_PATH
+from registry import registry, CHROMA_COLLECTION_NAME
 
 student_feedback_marks: Dict[str, Dict[str, str]] = {}
 
@@ -27,39 +21,18 @@ def read_pdf(file_path):
         return None
 
 class AssignmentChecker:
-    def __init__(self):
-        load_dotenv()
-        api_key = os.getenv('GEMINI_API')
-        if not api_key:
+    def __init__(self, db=None, gemini_model=None, embedding_model=None, collection=None):
+        # Shared clients come from the process-wide registry unless injected
+        self.gemini_model = gemini_model if gemini_model is not None else registry.gemini_model
+        if self.gemini_model is None:
             raise ValueError("Gemini api key isnt present ")
-        genai.configure(api_key=api_key)
-        self.gemini_model = genai.GenerativeModel('gemini-2.0-flash')
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.embedding_model = embedding_model if embedding_model is not None else registry.embedding_model
 
-        try:
-            firebase_creds_base64 = os.environ.get('FIREBASE_ADMIN_CREDENTIALS_B64')
-    
-            if not firebase_creds_base64:
-                # Fallback to local file for development
-                cred = credentials.Certificate("tibby-teach-firebase-adminsdk-fbsvc-a51c5b7b7b.json")
-            else:
-                # Decode and load credentials from base64
-                decoded_json = base64.b64decode(firebase_creds_base64).decode("utf-8")
-                cred_dict = json.loads(decoded_json)
-                cred = credentials.Certificate(cred_dict)
-
-            firebase_admin.initialize_app(cred)
-
-        except Exception as e:
-            print(f"Failed to initialize Firebase: {str(e)}")
-            raise
-        self.db = firestore.client()
+        self.db = db if db is not None else registry.db
         self.submissions_collection = self.db.collection('submissions')
 
-        # Initializing chromadb
-        self.chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-        self.collection_name = "student_submissions"
-        self.collection = self.chroma_client.get_or_create_collection(name=self.collection_name)
+        self.collection_name = CHROMA_COLLECTION_NAME
+        self.collection = collection if collection is not None else registry.chroma_collection
         self.expected_embedding_dimension = None
 
         # Assignment details
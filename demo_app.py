@@ -1,6 +1,5 @@
-import firebase_admin
-from firebase_admin import credentials, auth, firestore
-from fastapi import FastAPI, Header, HTTPException, Depends, Response, UploadFile, File, Form
+from firebase_admin import auth, firestore
+from fastapi import FastAPI, Header, HTTPException, Depends, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Dict, Any, List, Optional
 from pydantic import BaseModel
@@ -12,22 +11,30 @@ from quiz import generate_quiz_json
 from call_gemini import generate_response
 from demo_coursemap import CourseGenerator
 from demo_GradeSubmissions import AssignmentChecker
+import asyncio
+from contextlib import asynccontextmanager
 import os
-import tempfile
-import shutil
 from demo_uploadAssignment import UploadAssignment
-from demo_assignmentgenerator import AssignmentGenerator
-from fastapi.responses import FileResponse, JSONResponse
+from demo_assignment_generator import AssignmentGenerator
+from registry import registry
+from uploads import spool_upload, UploadTooLarge, BodySizeLimitMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+import io
 # Pip installs:
 # pip install firebase-admin fastapi uvicorn pydantic
 
-# Initialize Firebase Admin SDK
-cred = credentials.Certificate("tibby-teach-firebase-adminsdk-fbsvc-a51c5b7b7b.json")
-firebase_admin.initialize_app(cred)
+db = registry.db
 
-db = firestore.client()
-app = FastAPI()
-generator = AssignmentGenerator()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the shared models and clients once per worker
+    await asyncio.to_thread(registry.load)
+    yield
+    registry.close()
+
+app = FastAPI(lifespan=lifespan)
+# Innermost, so its 413s still get CORS headers
+app.add_middleware(BodySizeLimitMiddleware)
 assignment_cache = {}
 # Configure CORS
 origins = ["*"]
@@ -106,6 +113,20 @@ class AssignmentGenerationRequest(BaseModel):
     additional_requirements: Optional[str] = None
     custom_duration: Optional[str] = None
 
+def get_course_generator() -> CourseGenerator:
+    return CourseGenerator(model=registry.gemini_model)
+
+def get_assignment_checker() -> AssignmentChecker:
+    return AssignmentChecker(db=registry.db, gemini_model=registry.gemini_model,
+                             embedding_model=registry.embedding_model, collection=registry.chroma_collection)
+
+def get_upload_handler() -> UploadAssignment:
+    return UploadAssignment(db=registry.db, embedding_model=registry.embedding_model,
+                            collection=registry.chroma_collection)
+
+def get_assignment_generator() -> AssignmentGenerator:
+    return AssignmentGenerator(model=registry.gemini_model)
+
 def verify_token(id_token: str) -> Dict[str, Any]:
     try:
         decoded_token = auth.verify_id_token(id_token)
@@ -142,7 +163,7 @@ async def chat_with_memory(request: ChatRequest, user_id: str = Depends(get_user
     user_prompt = f"{chat_history}\nUser: {request.userMessage}\nAssistant:"
 
     # Call Gemini API
-    response = generate_response(user_prompt)
+    response = await generate_response(user_prompt)
 
     # Save AI-generated response in Firestore under messages subcollection
     new_message_ref = chat_ref.collection("messages").document()
@@ -378,7 +399,7 @@ async def get_messages(chat_id: str):
 async def visualsummary(request: VisualSummaryRequest, user_id: str = Depends(get_user_id)):
     logger.info(f"Received request: topic={request.topic}, rag={request.rag}")
     topic = request.topic
-    visual_summary = generate_visual_summary_json(topic, request.rag)
+    visual_summary = await generate_visual_summary_json(topic, request.rag)
     file_ref = db.collection("files").document()
     file_ref.set({
         "userId": user_id,
@@ -395,7 +416,7 @@ async def visualsummary(request: VisualSummaryRequest, user_id: str = Depends(ge
 async def generate_quiz(request: QuizRequest, user_id: str = Depends(get_user_id)):
     logger.info(f"Received quiz request: topic={request.topic}, rag={request.rag}")
     topic = request.topic
-    quiz_data = generate_quiz_json(topic, request.rag)
+    quiz_data = await generate_quiz_json(topic, request.rag)
     file_ref = db.collection("files").document()
     file_ref.set({
         "userId": user_id,
@@ -423,24 +444,20 @@ async def update_file(file_id: str, file: FileData, user_id: str = Depends(get_u
     return {"message": "File updated successfully"}
 
 @app.post("/api/generate-course-map/")
-async def generate_course_map(request: CourseMapRequest, user_id: str = Depends(get_user_id)):
+async def generate_course_map(
+    request: CourseMapRequest,
+    user_id: str = Depends(get_user_id),
+    course_generator: CourseGenerator = Depends(get_course_generator)
+):
     try:
-        course_generator = CourseGenerator()
         course_details = request.model_dump()
         
-        # Generate the curriculum
-        pdf_path = course_generator.generate_curriculum(course_details)
-        
-        # Read the generated PDF file
-        with open(pdf_path, 'rb') as f:
-            pdf_content = f.read()
-            
-        # Clean up the temporary file
-        os.remove(pdf_path)
+        # Generate the curriculum straight into memory
+        pdf_content = await asyncio.to_thread(course_generator.generate_curriculum, course_details)
         
         # Return the PDF file
-        return Response(
-            content=pdf_content,
+        return StreamingResponse(
+            io.BytesIO(pdf_content),
             media_type="application/pdf",
             headers={
                 "Content-Disposition": f'attachment; filename="{request.topic.replace(" ", "_")}_curriculum.pdf"'
@@ -451,9 +468,12 @@ async def generate_course_map(request: CourseMapRequest, user_id: str = Depends(
         raise HTTPException(status_code=500, detail="Error generating course map")
 
 @app.post("/api/load-assignment-details/")
-async def load_assignment_details(request: AssignmentDetailsRequest, user_id: str = Depends(get_user_id)):
+async def load_assignment_details(
+    request: AssignmentDetailsRequest,
+    user_id: str = Depends(get_user_id),
+    assignment_checker: AssignmentChecker = Depends(get_assignment_checker)
+):
     try:
-        assignment_checker = AssignmentChecker()
         assignment_checker.load_assignment_details(request.questions_pdf_path, request.answers_pdf_path)
         
         # Store the assignment details in Firestore
@@ -471,9 +491,12 @@ async def load_assignment_details(request: AssignmentDetailsRequest, user_id: st
         raise HTTPException(status_code=500, detail=f"Error loading assignment details: {str(e)}")
 
 @app.post("/api/process-submissions/")
-async def process_submissions(request: ProcessSubmissionsRequest, user_id: str = Depends(get_user_id)):
+async def process_submissions(
+    request: ProcessSubmissionsRequest,
+    user_id: str = Depends(get_user_id),
+    assignment_checker: AssignmentChecker = Depends(get_assignment_checker)
+):
     try:
-        assignment_checker = AssignmentChecker()
         results = assignment_checker.process_all_submissions(request.assignment_id)
         
         # Store the results in Firestore
@@ -489,9 +512,12 @@ async def process_submissions(request: ProcessSubmissionsRequest, user_id: str =
         raise HTTPException(status_code=500, detail=f"Error processing submissions: {str(e)}")
 
 @app.post("/api/submission-status/")
-async def get_submission_status(request: SubmissionStatusRequest, user_id: str = Depends(get_user_id)):
+async def get_submission_status(
+    request: SubmissionStatusRequest,
+    user_id: str = Depends(get_user_id),
+    assignment_checker: AssignmentChecker = Depends(get_assignment_checker)
+):
     try:
-        assignment_checker = AssignmentChecker()
         status = assignment_checker.get_submission_status(request.submission_id)
         return status
     except Exception as e:
@@ -522,10 +548,8 @@ async def upload_pdf(
     
     temp_file_path = None
     try:
-        # Create a temporary file to store the uploaded PDF
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            shutil.copyfileobj(file.file, temp_file)
-            temp_file_path = temp_file.name
+        # Stream the uploaded PDF to a temporary file, enforcing the size limit as it arrives
+        temp_file_path, _ = await spool_upload(file)
         
         # Check if assignment document exists, create if not
         assignment_ref = db.collection("assignments").document(assignment_id)
@@ -552,6 +576,8 @@ async def upload_pdf(
         
         return {"status": "success", "file_path": file_path}
     
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         # Log the error for debugging
         logging.error(f"Error uploading PDF: {str(e)}")
@@ -608,7 +634,8 @@ async def upload_submission(
     file: UploadFile = File(...),
     assignment_id: str = Form(...),
     student_id: str = Form(...),
-    user_id: str = Depends(get_user_id)
+    user_id: str = Depends(get_user_id),
+    upload_handler: UploadAssignment = Depends(get_upload_handler)
 ):
     # Validate required fields
     if not assignment_id or not student_id:
@@ -616,14 +643,12 @@ async def upload_submission(
     
     temp_file_path = None
     try:
-        # Create a temporary file to store the upload
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            shutil.copyfileobj(file.file, temp_file)
-            temp_file_path = temp_file.name
+        # Stream the upload to a temporary file, enforcing the size limit as it arrives
+        temp_file_path, _ = await spool_upload(file)
         
-        # Initialize UploadAssignment and process the submission
-        upload_handler = UploadAssignment()
-        doc_id = upload_handler.upload_submission(
+        # Process the submission with the shared upload handler
+        doc_id = await asyncio.to_thread(
+            upload_handler.upload_submission,
             file_path=temp_file_path,
             assignment_id=assignment_id,
             student_id=student_id
@@ -638,6 +663,8 @@ async def upload_submission(
         
         return {"message": "Submission uploaded successfully", "submission_id": doc_id}
     
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         # Log the error for debugging
         logging.error(f"Error in upload_submission: {str(e)}")
@@ -658,15 +685,15 @@ async def upload_submission(
 @app.post("/api/process-all-submissions/")
 async def process_all_submissions(
     assignment_id: str = Form(...),
-    user_id: str = Depends(get_user_id)
+    user_id: str = Depends(get_user_id),
+    checker: AssignmentChecker = Depends(get_assignment_checker)
 ):
     # Validate required fields
     if not assignment_id:
         raise HTTPException(status_code=400, detail="assignment_id is required")
     
     try:
-        # Initialize AssignmentChecker and process all submissions
-        checker = AssignmentChecker()
+        # Process all submissions with the shared clients
         result = checker.process_all_submissions(assignment_id)
         
         # Store the results in Firestore
@@ -693,7 +720,8 @@ async def generate_assignment(
     additional_requirements: Optional[str] = Form(None),
     custom_duration: Optional[str] = Form(None),
     pdf_file: Optional[UploadFile] = File(None),
-    user_id: str = Depends(get_user_id)
+    user_id: str = Depends(get_user_id),
+    generator: AssignmentGenerator = Depends(get_assignment_generator)
 ):
     # Handle custom duration
     if duration == 'custom' and custom_duration:
@@ -702,10 +730,10 @@ async def generate_assignment(
     # Save uploaded PDF if provided
     pdf_path = None
     if pdf_file and pdf_file.filename.endswith('.pdf'):
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            content = await pdf_file.read()
-            temp_file.write(content)
-            pdf_path = temp_file.name
+        try:
+            pdf_path, _ = await spool_upload(pdf_file)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
     
     # Create question details based on number of questions
     question_details = [{"type": "TEXT", "marks": 100 // num_questions} for _ in range(num_questions)]
@@ -743,7 +771,8 @@ async def generate_assignment(
 async def download_assignment_pdf(
     assignment_id: str,
     include_answers: bool = False,
-    user_id: str = Depends(get_user_id)
+    user_id: str = Depends(get_user_id),
+    generator: AssignmentGenerator = Depends(get_assignment_generator)
 ):
     # Check if the assignment exists in cache
     if assignment_id not in assignment_cache:
@@ -752,9 +781,9 @@ async def download_assignment_pdf(
     # Get the assignment data
     assignment_data = assignment_cache[assignment_id]
     
-    # Generate the PDF
-    pdf_path = generator.create_pdf(assignment_data, include_answers)
-    if not pdf_path:
+    # Generate the PDF in memory
+    pdf_content = await asyncio.to_thread(generator.create_pdf, assignment_data, include_answers)
+    if not pdf_content:
         raise HTTPException(status_code=500, detail="Failed to generate PDF")
     
     # Create a descriptive filename
@@ -762,10 +791,10 @@ async def download_assignment_pdf(
     filename = f"{assignment_data['topic'].replace(' ', '_')}_{pdf_type}.pdf"
     
     # Return the PDF file
-    return FileResponse(
-        path=pdf_path,
+    return StreamingResponse(
+        io.BytesIO(pdf_content),
         media_type="application/pdf",
-        filename=filename
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
 
 if __name__ == "__main__":
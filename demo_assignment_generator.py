@@ -1,7 +1,5 @@
-import google.generativeai as genai
+import io
 import PyPDF2
-from dotenv import load_dotenv
-import os
 import re
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -9,26 +7,24 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib import colors
 from reportlab.lib.units import inch
 import json
+import mmap
+from registry import registry
+
 def read_pdf(file_path):
     try:
-        with open(file_path, "rb") as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() or ""
-            return text
+        # Memory-map the file so the reader pages through it instead of loading it whole
+        with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            reader = PyPDF2.PdfReader(mapped)
+            return "".join(page.extract_text() or "" for page in reader.pages)
     except Exception as e:
         print(f"Error reading PDF: {e}")
         return None
 
 class AssignmentGenerator:
-    def __init__(self):
-        load_dotenv()
-        api_key = os.getenv('GEMINI_API')
-        if not api_key:
+    def __init__(self, model=None):
+        self.model = model if model is not None else registry.gemini_model
+        if self.model is None:
             raise ValueError("GEMINI_API is not set in the environment variables.")
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
 
     def generate_assignment(self, topic, credentials_file_path, question_details, pdf_file=None, duration=None, difficulty=None, learning_objectives=None, additional_requirements=None):
         try:
@@ -85,9 +81,11 @@ class AssignmentGenerator:
             return None
 
     def create_pdf(self, assignment_data, include_answers=True):
+        """Render the assignment and return the PDF bytes, or None on failure."""
         try:
-            filename = "assignment.pdf" if include_answers else "questions.pdf"
-            doc = SimpleDocTemplate(filename, pagesize=letter)
+            # Build into a per-call buffer so concurrent renders never share a file
+            buffer = io.BytesIO()
+            doc = SimpleDocTemplate(buffer, pagesize=letter)
             styles = getSampleStyleSheet()
             content = []
 
@@ -114,7 +112,7 @@ class AssignmentGenerator:
                 content.append(Spacer(1, 12))
 
             doc.build(content)
-            return filename
+            return buffer.getvalue()
 
         except Exception as e:
             print(f"PDF creation error: {e}")
@@ -1,12 +1,15 @@
-import google.generativeai as genai
 from typing import List, Dict
 from fpdf import FPDF
 import os
-from dotenv import load_dotenv
-import tempfile
 import random
 import json
+import logging
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from registry import registry
+
+logger = logging.getLogger(__name__)
 
 def return_json(responseText):
     json_string = re.sub(r'```json\s*([\s\S]*?)\s*```', r'\1', responseText).strip()
@@ -337,13 +340,10 @@ class customPDF(FPDF):
         self.ln(10)
 
 class CourseGenerator:
-    def __init__(self):
-        load_dotenv()
-        api_key = os.getenv('GEMINI_API')
-        if not api_key:
+    def __init__(self, model=None):
+        self.model = model if model is not None else registry.gemini_model
+        if self.model is None:
             raise ValueError("GEMINI_API key not found in environment variables")
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
 
     def _generate_json_content(self, prompt: str) -> dict:
         """Helper method to generate and parse JSON content from the model"""
@@ -497,7 +497,7 @@ class CourseGenerator:
         result = self._generate_json_content(prompt)
         return result[:7] if isinstance(result, list) else []
 
-    def format_pdf(self, details, outcomes, overview, modules, assessments, resources) -> str:
+    def format_pdf(self, details, outcomes, overview, modules, assessments, resources) -> bytes:
         # [Existing format_pdf method remains largely unchanged]
         pdf = customPDF(course_title=details['topic'], author=details.get('instructor', 'Course Creator'))
         
@@ -539,15 +539,46 @@ class CourseGenerator:
         pdf.add_page()
         pdf.add_resources_box("Recommended Resources", resources)
         
-        output_file = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False).name
-        pdf.output(output_file, 'F')
-        return output_file
+        # Render straight to memory; fpdf 1.x returns the document as a latin-1 str
+        return pdf.output(dest='S').encode('latin-1')
+
+    def _generate_sections(self, course_details: dict, timeout: float) -> dict:
+        """Run the independent section generators concurrently.
 
-    def generate_curriculum(self, course_details: dict) -> str:
-        detailed_content = self.generate_detailed_content(course_details)
-        course_overview = self.generate_course_overview(course_details)
-        assessments = self.generate_assessment_structure(course_details)
-        resources = self.generate_resources(course_details)
+        Each curriculum gets its own pool with one thread per section, so every
+        call starts immediately and the shared deadline measures running time,
+        not time spent queued behind other requests. A call that fails or
+        misses it falls back to an empty section so the PDF is still produced.
+        """
+        sections = {
+            "detailed_content": (self.generate_detailed_content, {"outcomes": [], "modules": []}),
+            "course_overview": (self.generate_course_overview, ""),
+            "assessments": (self.generate_assessment_structure, []),
+            "resources": (self.generate_resources, []),
+        }
+        executor = ThreadPoolExecutor(max_workers=len(sections), thread_name_prefix="coursemap")
+        try:
+            futures = {name: executor.submit(fn, course_details) for name, (fn, _) in sections.items()}
+            deadline = time.monotonic() + timeout
+            results = {}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result(timeout=max(0, deadline - time.monotonic()))
+                except Exception as e:
+                    logger.warning(f"Course map section {name} fell back to empty: {type(e).__name__} {e}")
+                    results[name] = sections[name][1]
+            return results
+        finally:
+            # Don't wait for timed-out calls; their threads exit when the call returns
+            executor.shutdown(wait=False)
+
+    def generate_curriculum(self, course_details: dict, timeout: float = None) -> bytes:
+        timeout = timeout or float(os.getenv("COURSE_MAP_SECTION_TIMEOUT", "60"))
+        sections = self._generate_sections(course_details, timeout)
+        detailed_content = sections["detailed_content"]
+        course_overview = sections["course_overview"]
+        assessments = sections["assessments"]
+        resources = sections["resources"]
         
         return self.format_pdf(
             course_details,
@@ -570,5 +601,8 @@ if __name__ == "__main__":
         "instructor": "Dr. Snehal Sharma and Prof. Siddharth Kini"
     }
     generator = CourseGenerator()
-    pdf_path = generator.generate_curriculum(course_details)
+    pdf_bytes = generator.generate_curriculum(course_details)
+    pdf_path = "curriculum.pdf"
+    with open(pdf_path, "wb") as f:
+        f.write(pdf_bytes)
     print(f"Generated PDF at: {pdf_path}")
\ No newline at end of file
@@ -1,61 +1,29 @@
-import google.generativeai as genai
 import PyPDF2, os, tempfile, random
-from dotenv import load_dotenv
 from typing import List, Dict
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-import io, time
+import io
+import mmap
 import shutil
-import chromadb
-from sentence_transformers import SentenceTransformer
-import firebase_admin
-from firebase_admin import credentials, firestore
 from datetime import datetime
 import re
-from firebase_admin import firestore
 import numpy as np
-import base64
-import json
-# Define the ChromaDB path in a single place
-CHROMA_DB_PATH = os.path.abspath("./chroma_db")
+from registry import registry, CHROMA_COLLECTION_NAME
+from chunking import chunk_text
 
 class UploadAssignment:
-    def __init__(self):
-        load_dotenv()
-        api_key = os.getenv('GEMINI_API')
-        if not api_key:
-            raise ValueError("Gemini api key not found")
-        genai.configure(api_key = api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2') # Initialize SentenceTransformer
-
-        # Initialize Firebase
-        try:
-            firebase_creds_base64 = os.environ.get('FIREBASE_ADMIN_CREDENTIALS_B64')
-    
-            if not firebase_creds_base64:
-                # Fallback to local file for development
-                cred = credentials.Certificate("tibby-teach-firebase-adminsdk-fbsvc-a51c5b7b7b.json")
-            else:
-                # Decode and load credentials from base64
-                decoded_json = base64.b64decode(firebase_creds_base64).decode("utf-8")
-                cred_dict = json.loads(decoded_json)
-                cred = credentials.Certificate(cred_dict)
-
-            firebase_admin.initialize_app(cred)
-
-        except Exception as e:
-            print(f"Failed to initialize Firebase: {str(e)}")
-            raise
-        self.db = firestore.client()
+    def __init__(self, db=None, embedding_model=None, collection=None):
+        # Shared clients come from the process-wide registry unless injected
+        self.db = db if db is not None else registry.db
+        self.embedding_model = embedding_model if embedding_model is not None else registry.embedding_model
+        if self.embedding_model is None:
+            raise ValueError("Embedding model is not available")
         self.submissions_collection = self.db.collection('submissions')
 
-        #Initialising chromadb
-        self.chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-        self.collection_name = "student_submissions"
-        self.collection = self.chroma_client.get_or_create_collection(name=self.collection_name)
-        self.expected_embedding_dimension = 384 # Set the expected dimension to 384
+        self.collection_name = CHROMA_COLLECTION_NAME
+        self.collection = collection if collection is not None else registry.chroma_collection
+        self.batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
 
     def upload_submission(self, file_path, assignment_id, student_id):
         """
@@ -70,32 +38,30 @@ class UploadAssignment:
             str: Firestore document ID, or None if there was an error.
         """
         try:
-            # Read the file content
-            with open(file_path, "rb") as file:
-                if file_path.lower().endswith('.pdf'):
-                    pdf_reader = PyPDF2.PdfReader(file)
-                    text = ""
-                    for page in pdf_reader.pages:
-                        text += page.extract_text() or ""
-                else:
-                    content = file.read()
-                    # Try to decode as UTF-8, fall back to binary if that fails
-                    try:
-                        text = content.decode('utf-8')
-                    except UnicodeDecodeError:
-                        # If UTF-8 decode fails, use a binary-safe encoding
-                        text = content.decode('latin-1')
-
-            # Generate embeddings using SentenceTransformer
-            embeddings = self.embedding_model.encode(text).tolist() # Use SentenceTransformer to generate embeddings
+            # Read the file content straight from disk; PDFs are memory-mapped so the
+            # reader pages through the file instead of loading it into memory
+            if file_path.lower().endswith('.pdf'):
+                with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    pdf_reader = PyPDF2.PdfReader(mapped)
+                    text = "".join(page.extract_text() or "" for page in pdf_reader.pages)
+            else:
+                # Try to decode as UTF-8, fall back to binary if that fails
+                try:
+                    with open(file_path, encoding='utf-8') as file:
+                        text = file.read()
+                except UnicodeDecodeError:
+                    # If UTF-8 decode fails, use a binary-safe encoding
+                    with open(file_path, encoding='latin-1') as file:
+                        text = file.read()
 
-            # Pad or truncate embeddings to match the expected dimension
-            if len(embeddings) < self.expected_embedding_dimension:
-                print(f"Padding embedding from {len(embeddings)} to {self.expected_embedding_dimension}")
-                embeddings.extend([0.0] * (self.expected_embedding_dimension - len(embeddings)))
-            elif len(embeddings) > self.expected_embedding_dimension:
-                print(f"Truncating embedding from {len(embeddings)} to {self.expected_embedding_dimension}")
-                embeddings = embeddings[:self.expected_embedding_dimension]
+            # Split into overlapping windows the model can see in full (it truncates
+            # at 256 word pieces) and embed them all in one batched call
+            chunks = chunk_text(text, self.embedding_model)
+            embeddings = []
+            if chunks:
+                embeddings = self.embedding_model.encode(
+                    chunks, batch_size=self.batch_size, show_progress_bar=False
+                ).tolist()
 
             # Metadata for Firestore
             metadata = {
@@ -103,6 +69,7 @@ class UploadAssignment:
                 "student_id": student_id,
                 "file_path": file_path,
                 "submission_text": text,
+                "chunk_count": len(chunks),
                 "timestamp": datetime.now()
             }
 
@@ -111,21 +78,27 @@ class UploadAssignment:
             doc_ref.set(metadata)
             firestore_doc_id = doc_ref.id
 
-            # Add to ChromaDB
-            chroma_metadata = {
-                "assignment_id": assignment_id,
-                "student_id": student_id,
-                "firestore_doc_id": firestore_doc_id
-            }
-            self.collection.add(
-                documents=[text],
-                embeddings=[embeddings],
-                metadatas=[chroma_metadata],
-                ids=[firestore_doc_id]
-            )
+            # Add one ChromaDB entry per chunk, linked back to the submission
+            if chunks:
+                self.collection.add(
+                    documents=chunks,
+                    embeddings=embeddings,
+                    metadatas=[
+                        {
+                            "assignment_id": assignment_id,
+                            "student_id": student_id,
+                            "firestore_doc_id": firestore_doc_id,
+                            "chunk_index": index,
+                            "chunk_count": len(chunks)
+                        }
+                        for index in range(len(chunks))
+                    ],
+                    ids=[f"{firestore_doc_id}:{index}" for index in range(len(chunks))]
+                )
+            else:
+                print(f"No text extracted from {file_path}; skipping ChromaDB.")
 
-            print(f"File from {file_path} saved to Firestore with ID: {firestore_doc_id} and ChromaDB.")
-            time.sleep(1)
+            print(f"File from {file_path} saved to Firestore with ID: {firestore_doc_id} and ChromaDB ({len(chunks)} chunks).")
             return firestore_doc_id
 
         except Exception as e:
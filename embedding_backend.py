@@ -0,0 +1,54 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# "torch" (default), "onnx" (fp32 ONNX Runtime) or "onnx-int8" (dynamically quantized ONNX Runtime)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# Quantized export to load for "onnx-int8"; the MiniLM repo ships avx2, avx512, avx512_vnni and arm64 variants
+EMBEDDING_ONNX_INT8_FILE = os.getenv("EMBEDDING_ONNX_INT8_FILE", "onnx/model_qint8_avx2.onnx")
+
+# Load the PyTorch model when an ONNX backend fails instead of raising (opt-in)
+EMBEDDING_BACKEND_FALLBACK = os.getenv("EMBEDDING_BACKEND_FALLBACK", "0") == "1"
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def loaded_backend(model):
+    """Which entry of BACKENDS a model returned by load_embedding_model actually runs on."""
+    return getattr(model, "embedding_backend", "torch")
+
+
+def load_embedding_model(model_name, backend=None, fallback=None):
+    """
+    Load `model_name` as a SentenceTransformer on the configured inference backend.
+
+    Every backend returns a SentenceTransformer, so callers keep using
+    `model.encode(...)` unchanged. The ONNX backends run inference through
+    ONNX Runtime (requires `optimum[onnxruntime]`). If they cannot be loaded
+    the error is raised, unless `fallback` (default EMBEDDING_BACKEND_FALLBACK)
+    allows using the PyTorch model instead; `loaded_backend()` tells which one
+    was actually loaded.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    backend = backend or EMBEDDING_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r}, expected one of {', '.join(BACKENDS)}")
+
+    fallback = EMBEDDING_BACKEND_FALLBACK if fallback is None else fallback
+
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+
+    model_kwargs = {"file_name": EMBEDDING_ONNX_INT8_FILE} if backend == "onnx-int8" else {}
+    try:
+        model = SentenceTransformer(model_name, backend="onnx", model_kwargs=model_kwargs)
+    except Exception as e:
+        if not fallback:
+            raise
+        logger.error(f"Failed to load {model_name} with the {backend} backend, falling back to torch: {str(e)}")
+        return SentenceTransformer(model_name)
+    model.embedding_backend = backend
+    logger.info(f"Loaded {model_name} with the {backend} backend")
+    return model
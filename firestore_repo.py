@@ -0,0 +1,63 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+class FirestoreRepository:
+    """
+    Async facade over the synchronous Firestore client.
+
+    Building references and queries is local and cheap, so routes still do that
+    with `repo.collection(...)`. Anything that talks to Firestore (get, set,
+    update, stream, commit) is awaited through this class, which runs it on a
+    bounded thread pool instead of the uvicorn event loop.
+    """
+
+    def __init__(self, client, max_workers=None):
+        self.client = client
+        max_workers = max_workers or int(os.getenv("FIRESTORE_MAX_WORKERS", "32"))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="firestore")
+
+    def collection(self, name):
+        return self.client.collection(name)
+
+    def batch(self):
+        return self.client.batch()
+
+    async def run(self, fn, *args, **kwargs):
+        """Run any blocking Firestore callable on the repository's thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def get(self, ref):
+        return await self.run(ref.get)
+
+    async def set(self, ref, data, merge=False):
+        return await self.run(ref.set, data, merge=merge)
+
+    async def update(self, ref, data):
+        return await self.run(ref.update, data)
+
+    async def delete(self, ref):
+        return await self.run(ref.delete)
+
+    async def get_all(self, refs, field_paths=None):
+        """Fetch many documents in one batched round trip, in the order of `refs`."""
+        refs = list(refs)
+        if not refs:
+            return []
+        snapshots = await self.run(lambda: list(self.client.get_all(refs, field_paths=field_paths)))
+        # get_all yields in arbitrary order
+        by_path = {snapshot.reference.path: snapshot for snapshot in snapshots}
+        return [by_path[ref.path] for ref in refs]
+
+    async def stream(self, query):
+        """Execute a query and return all of its snapshots as a list."""
+        return await self.run(lambda: list(query.stream()))
+
+    async def commit(self, batch):
+        return await self.run(batch.commit)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,188 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from dotenv import load_dotenv
+from google import genai
+
+load_dotenv()
+
+
+def _parse_rate_limits(spec):
+    """Parse "model=rpm,model=rpm" into {model: requests per minute}."""
+    limits = {}
+    for entry in filter(None, (part.strip() for part in (spec or "").split(","))):
+        model, _, rpm = entry.partition("=")
+        limits[model.strip()] = float(rpm)
+    return limits
+
+
+class _RateLimiter:
+    """Spaces requests to one model evenly so they never exceed `rpm` per minute."""
+
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Claim the next slot and return how long the caller must wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+            return slot - now
+
+
+class _Slots:
+    """
+    A concurrency limit shared by threads and coroutines.
+
+    Waiters are served first come, first served; a coroutine waits on a
+    future rather than blocking the event loop.
+    """
+
+    def __init__(self, limit):
+        self._free = limit
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _take_or_wait(self, waiter):
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return True
+            self._waiters.append(waiter)
+            return False
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._free += 1
+                return
+            waiter = self._waiters.popleft()
+        # Hand the slot straight to the next waiter
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            loop, future = waiter
+            loop.call_soon_threadsafe(self._wake, future)
+
+    def _wake(self, future):
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+    @contextmanager
+    def hold(self):
+        event = threading.Event()
+        if not self._take_or_wait(event):
+            event.wait()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def hold_async(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (loop, future)
+        if not self._take_or_wait(waiter):
+            try:
+                await future
+            except asyncio.CancelledError:
+                with self._lock:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                        raise
+                # Already handed over: give it back (a cancelled future is
+                # released by _wake instead)
+                if future.done() and not future.cancelled():
+                    self.release()
+                raise
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class GeminiClient:
+    """
+    One long-lived google.genai client shared by every generation path.
+
+    Reusing a single client keeps its HTTP connection pool and TLS sessions
+    alive between requests. Calls are capped at GEMINI_MAX_CONCURRENCY in
+    flight across the async and blocking paths together, and models listed in
+    GEMINI_RATE_LIMITS ("model=rpm,...") are additionally spaced to their
+    requests-per-minute budget. Callers wait for their rate-limit slot before
+    taking a concurrency slot, so a throttled model never holds one idle.
+    """
+
+    def __init__(self, api_key=None, max_concurrency=None, rate_limits=None):
+        self._client = genai.Client(api_key=api_key or os.getenv("GEMINI_API"))
+        max_concurrency = max_concurrency or int(os.getenv("GEMINI_MAX_CONCURRENCY", "16"))
+        self._slots = _Slots(max_concurrency)
+        if rate_limits is None:
+            rate_limits = _parse_rate_limits(os.getenv("GEMINI_RATE_LIMITS"))
+        self._limiters = {model: _RateLimiter(rpm) for model, rpm in rate_limits.items()}
+
+    def _delay_for(self, model):
+        limiter = self._limiters.get(model)
+        return limiter.reserve() if limiter else 0.0
+
+    async def generate_content(self, model, contents, config=None):
+        delay = self._delay_for(model)
+        if delay:
+            await asyncio.sleep(delay)
+        async with self._slots.hold_async():
+            return await self._client.aio.models.generate_content(model=model, contents=contents, config=config)
+
+    async def generate_content_stream(self, model, contents, config=None):
+        """Yield response chunks; the concurrency slot is held until the stream ends."""
+        delay = self._delay_for(model)
+        if delay:
+            await asyncio.sleep(delay)
+        async with self._slots.hold_async():
+            stream = await self._client.aio.models.generate_content_stream(model=model, contents=contents, config=config)
+            async for chunk in stream:
+                yield chunk
+
+    def generate_content_sync(self, model, contents, config=None):
+        """Blocking variant for code that runs in worker threads."""
+        delay = self._delay_for(model)
+        if delay:
+            time.sleep(delay)
+        with self._slots.hold():
+            return self._client.models.generate_content(model=model, contents=contents, config=config)
+
+
+class GeminiModel:
+    """
+    Stand-in for google.generativeai.GenerativeModel backed by the shared client,
+    so the class-based generators keep calling `model.generate_content(prompt)`.
+    """
+
+    def __init__(self, client, model_name):
+        self.client = client
+        self.model_name = model_name
+
+    def generate_content(self, contents):
+        return self.client.generate_content_sync(self.model_name, contents)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide GeminiClient, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GeminiClient()
+        return _client
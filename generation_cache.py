@@ -0,0 +1,126 @@
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", (text or "").strip())
+
+
+def cache_key(endpoint, model, template_version, topic, rag):
+    """Hash of everything that determines a generation's output."""
+    payload = json.dumps({
+        "endpoint": endpoint,
+        "model": model,
+        "template_version": template_version,
+        "topic": _normalize(topic).casefold(),
+        "rag": _normalize(rag),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """
+    Two-tier cache for LLM-generated learning aids (quizzes, visual summaries).
+
+    Entries are looked up in a bounded in-process LRU first and then in the
+    `generation_cache` Firestore collection, which is shared by every worker.
+    Both tiers expire entries after GENERATION_CACHE_TTL_SECONDS; the Firestore
+    documents also carry an `expireAt` timestamp so a TTL policy can delete them.
+    Concurrent misses for the same key share one generation.
+    """
+
+    def __init__(self, repo, collection_name="generation_cache", max_size=None, ttl_seconds=None):
+        self.repo = repo
+        self.collection_name = collection_name
+        self.max_size = max_size or int(os.getenv("GENERATION_CACHE_SIZE", "256"))
+        self.ttl_seconds = ttl_seconds or int(os.getenv("GENERATION_CACHE_TTL_SECONDS", "86400"))
+        self._memory = TTLCache(self.max_size, clock=time.time)
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._stats = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "errors": 0}
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "memory_entries": len(self._memory)}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    async def _persistent_get(self, key):
+        doc = await self.repo.get(self.repo.collection(self.collection_name).document(key))
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        if data.get("expiresAt", 0) <= time.time():
+            return None
+        return data["payload"], data["expiresAt"]
+
+    async def get(self, key):
+        """Return a copy of the cached value for `key`, or None."""
+        value = self._memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return copy.deepcopy(value)
+        try:
+            found = await self._persistent_get(key)
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"Generation cache read failed: {str(e)}")
+            found = None
+        if found is None:
+            self._count("misses")
+            return None
+        value, expires_at = found
+        self._memory.set(key, value, expires_at)
+        self._count("persistent_hits")
+        return copy.deepcopy(value)
+
+    async def put(self, key, value, endpoint):
+        expires_at = time.time() + self.ttl_seconds
+        self._memory.set(key, copy.deepcopy(value), expires_at)
+        try:
+            await self.repo.set(self.repo.collection(self.collection_name).document(key), {
+                "endpoint": endpoint,
+                "payload": value,
+                "expiresAt": expires_at,
+                "expireAt": datetime.fromtimestamp(expires_at, tz=timezone.utc),
+            })
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"Generation cache write failed: {str(e)}")
+
+    async def get_or_generate(self, endpoint, key, generate, should_cache=bool):
+        """
+        Return the cached value for `key`, or await `generate()` and cache its
+        result when `should_cache(result)` is true (failed generations are not cached).
+        """
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is None:
+            async def produce():
+                result = await generate()
+                if should_cache(result):
+                    await self.put(key, result, endpoint)
+                return result
+
+            pending = asyncio.ensure_future(produce())
+            self._inflight[key] = pending
+            pending.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        return copy.deepcopy(await asyncio.shield(pending))
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import os
+import random
+
+from google.api_core import exceptions
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+RETRYABLE_ERRORS = (
+    exceptions.Aborted,
+    exceptions.DeadlineExceeded,
+    exceptions.ResourceExhausted,
+    exceptions.ServiceUnavailable,
+)
+
+
+class GradeWriter:
+    """
+    Persists grades for one assignment with as few writes as possible.
+
+    The per-student subcollection documents are grouped into batches of up
+    to MAX_BATCH_WRITES. Batches that fail with contention or transient errors
+    are rebuilt and retried with jittered exponential backoff. The assignment
+    document's `submissions` summary is left to `summary` (a SubmissionStore),
+    which folds the changes into its next batched update.
+    """
+
+    def __init__(self, repo, summary=None, max_attempts=None, base_delay=None):
+        self.repo = repo
+        self.summary = summary
+        self.max_attempts = max_attempts or int(os.getenv("GRADE_WRITE_MAX_ATTEMPTS", "5"))
+        self.base_delay = base_delay or float(os.getenv("GRADE_WRITE_BASE_DELAY", "0.25"))
+
+    async def _commit_with_retry(self, writes):
+        for attempt in range(self.max_attempts):
+            batch = self.repo.batch()
+            for ref, data in writes:
+                batch.update(ref, data)
+            try:
+                return await self.repo.commit(batch)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_attempts - 1:
+                    raise
+                delay = self.base_delay * (2 ** attempt) + random.uniform(0, self.base_delay)
+                logger.warning(f"Grade batch commit failed ({str(e)}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def write(self, assignment_ref, grades, graded_by):
+        """
+        Write grades to the assignment's submissions subcollection.
+
+        Args:
+            assignment_ref: Reference to the assignment document.
+            grades: Mapping of student id to a dict with `grade` and `feedback`.
+            graded_by: Value stored in `gradedBy` ("AI" or "teacher").
+        """
+        if not grades:
+            return
+
+        submissions_ref = assignment_ref.collection("submissions")
+        writes = []
+        for student_id, grade in grades.items():
+            fields = {
+                "status": "graded",
+                "grade": grade["grade"],
+                "feedback": grade["feedback"],
+                "gradedBy": graded_by
+            }
+            writes.append((submissions_ref.document(student_id), fields))
+
+        for start in range(0, len(writes), MAX_BATCH_WRITES):
+            chunk = writes[start:start + MAX_BATCH_WRITES]
+            await self._commit_with_retry(chunk)
+            # Summarize each batch as soon as it is committed, so a later
+            # failing batch can't leave committed grades out of the summary
+            if self.summary is not None:
+                for submission_ref, fields in chunk:
+                    self.summary.record(assignment_ref, submission_ref.id, fields)
@@ -0,0 +1,88 @@
+import os
+
+
+def feedback_for(similarity):
+    if similarity > 0.8:
+        return "Good understanding shown."
+    if similarity > 0.5:
+        return "Partial understanding shown."
+    return "Review this topic."
+
+
+class GradingEngine:
+    """
+    Scores free-text answers by embedding similarity to their question.
+
+    Each question is encoded once, every non-empty answer in the assignment is
+    encoded in a single batched call, and all answer/question similarities are
+    computed in one vectorized operation.
+    """
+
+    def __init__(self, model, batch_size=None):
+        self.model = model
+        self.batch_size = batch_size or int(os.getenv("GRADING_BATCH_SIZE", "64"))
+
+    def _encode(self, texts):
+        return self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_tensor=True,
+            show_progress_bar=False,
+        )
+
+    def grade(self, questions, submissions):
+        """
+        Grade every submission that is not already graded.
+
+        Args:
+            questions: The assignment's question dicts (`question_text`, `marks`).
+            submissions: Mapping of student id to submission dict with `answers`.
+
+        Returns:
+            Mapping of student id to a result dict with `mark` and `feedback`.
+        """
+        pending = {
+            student_id: submission for student_id, submission in submissions.items()
+            if submission.get("status") != "graded"
+        }
+
+        # Flatten every answered (student, question) pair into one batch
+        pairs = []
+        for student_id, submission in pending.items():
+            answers = submission.get("answers", {})
+            for q_idx in range(len(questions)):
+                student_answer = answers.get(str(q_idx), "").strip()
+                if student_answer:
+                    pairs.append((student_id, q_idx, student_answer))
+
+        similarities = []
+        if pairs:
+            question_embeddings = self._encode([question["question_text"] for question in questions])
+            answer_embeddings = self._encode([answer for _, _, answer in pairs])
+            q_indices = [q_idx for _, q_idx, _ in pairs]
+            from sentence_transformers import util  # already loaded alongside the model
+            similarities = util.pairwise_cos_sim(answer_embeddings, question_embeddings[q_indices]).tolist()
+
+        scores = {student_id: {} for student_id in pending}
+        for (student_id, q_idx, _), similarity in zip(pairs, similarities):
+            scores[student_id][q_idx] = similarity
+
+        results = {}
+        for student_id, question_similarities in scores.items():
+            total_score = 0
+            feedback = []
+            for q_idx in sorted(question_similarities):
+                similarity = question_similarities[q_idx]
+                marks = questions[q_idx]["marks"]
+                # Convert similarity to score (0-100)
+                question_score = int(similarity * marks)
+                total_score += question_score
+                feedback.append(f"Q{q_idx + 1}: {question_score}/{marks} - " + feedback_for(similarity))
+
+            results[student_id] = {
+                "status": "success",
+                "student_id": student_id,
+                "mark": f"{total_score}/100",
+                "feedback": "\n".join(feedback)
+            }
+        return results
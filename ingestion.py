@@ -0,0 +1,152 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict
+
+from uploads import spool_upload
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IngestionJob:
+    id: str
+    file_path: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+class IngestionQueue:
+    """
+    Background pipeline for uploaded submission files.
+
+    The upload endpoint calls `store()` to stream the raw file (plus a small
+    JSON sidecar describing the job) under INGESTION_DIR and `submit()` to
+    queue it, then returns straight away. INGESTION_WORKERS tasks call the
+    async `process(job)` callback, which does the slow extraction, embedding
+    and indexing. A job's sidecar is removed once it has been processed, so
+    jobs interrupted by a restart, or whose callback raised, are queued again
+    on `start()`. Processed files stay on disk for the callback to reference;
+    `discard()` removes jobs that will never be processed and `remove_file()`
+    files that are no longer referenced.
+
+    INGESTION_DIR is shared by every uvicorn worker, so sidecars carry the pid
+    of the worker that owns the job (`{id}.{pid}.job.json`). `start()` only
+    takes over jobs whose owner is no longer running, claiming each one with
+    an atomic rename so no job is picked up by two workers.
+    """
+
+    def __init__(self, process, directory=None, workers=None):
+        self.process = process
+        self.directory = os.path.abspath(directory or os.getenv("INGESTION_DIR", "./ingestion_uploads"))
+        self.workers = workers or int(os.getenv("INGESTION_WORKERS", "2"))
+        os.makedirs(self.directory, exist_ok=True)
+        self._queue = asyncio.Queue()
+        self._tasks = []
+
+    def _sidecar(self, job_id, pid=None):
+        return os.path.join(self.directory, f"{job_id}.{pid or os.getpid()}.job.json")
+
+    @staticmethod
+    def _owner_alive(pid):
+        if pid is None or pid == os.getpid():
+            # Unowned (written before sidecars were claimed), or our own pid reused after a restart
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _write_sidecar(self, job):
+        with open(self._sidecar(job.id), "w") as f:
+            json.dump(asdict(job), f)
+
+    async def store(self, upload, suffix, metadata, max_bytes=None):
+        """
+        Stream an UploadFile to disk and return its (not yet queued) job.
+        Raises uploads.UploadTooLarge, leaving nothing behind, if it exceeds `max_bytes`.
+        """
+        job_id = uuid.uuid4().hex
+        job = IngestionJob(job_id, os.path.join(self.directory, f"{job_id}{suffix}"), metadata)
+        await spool_upload(upload, job.file_path, max_bytes=max_bytes)
+        await asyncio.to_thread(self._write_sidecar, job)
+        return job
+
+    def remove_file(self, path):
+        """Delete an upload stored under INGESTION_DIR (blocking); other paths are ignored."""
+        path = os.path.abspath(path)
+        if os.path.dirname(path) != self.directory:
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def discard(self, job):
+        """Delete a job's file and sidecar (blocking; for jobs that were never or will never be processed)."""
+        self.remove_file(job.file_path)
+        try:
+            os.remove(self._sidecar(job.id))
+        except FileNotFoundError:
+            pass
+
+    def submit(self, job):
+        self._queue.put_nowait(job)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _load_unfinished(self):
+        jobs = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".job.json"):
+                continue
+            job_id, _, owner = name[:-len(".job.json")].partition(".")
+            if self._owner_alive(int(owner) if owner.isdigit() else None):
+                continue
+            claimed = self._sidecar(job_id)
+            try:
+                # Only one worker's rename can succeed
+                os.rename(os.path.join(self.directory, name), claimed)
+            except FileNotFoundError:
+                continue
+            try:
+                with open(claimed) as f:
+                    jobs.append(IngestionJob(**json.load(f)))
+            except (OSError, ValueError, TypeError) as e:
+                logger.warning(f"Skipping unreadable ingestion job {name}: {str(e)}")
+        return jobs
+
+    async def start(self):
+        for job in await asyncio.to_thread(self._load_unfinished):
+            logger.info(f"Requeueing unfinished ingestion job {job.id}")
+            self.submit(job)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        # Queued jobs keep their sidecars and are picked up on the next start
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self.process(job)
+            except Exception as e:
+                # Keep the sidecar so the job is retried on the next start
+                logger.error(f"Ingestion job {job.id} failed, will retry on restart: {str(e)}")
+                continue
+            finally:
+                self._queue.task_done()
+            try:
+                os.remove(self._sidecar(job.id))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,85 @@
+import logging
+import os
+import secrets
+import string
+from datetime import datetime, timedelta, timezone
+
+from firebase_admin import firestore
+from google.api_core import exceptions
+
+logger = logging.getLogger(__name__)
+
+# No 0/O or 1/I so codes survive being read aloud or copied from a whiteboard
+CODE_ALPHABET = "".join(c for c in string.ascii_uppercase + string.digits if c not in "0O1I")
+
+
+class JoinCodeRegistry:
+    """
+    Classroom join codes stored in a `joinCodes` collection keyed by the code.
+
+    Allocation uses `create()`, which fails if the document already exists, so
+    two classrooms can never receive the same code and a collision simply
+    retries with a fresh one. Joining resolves the code with a point read
+    instead of querying classrooms. Codes expire after JOIN_CODE_TTL_DAYS (0
+    keeps them forever) and carry an `expireAt` timestamp for a Firestore TTL
+    policy; teachers can rotate a code, which retires the old one at once.
+
+    Codes issued before the registry existed are reserved by running
+    scripts/backfill_join_codes.py once; after that a code missing from the
+    registry (never issued, or deleted by the TTL policy) does not resolve.
+    """
+
+    def __init__(self, repo, length=None, ttl_days=None, max_attempts=10):
+        self.repo = repo
+        self.length = length or int(os.getenv("JOIN_CODE_LENGTH", "6"))
+        self.ttl_days = ttl_days if ttl_days is not None else float(os.getenv("JOIN_CODE_TTL_DAYS", "0"))
+        self.max_attempts = max_attempts
+
+    @staticmethod
+    def normalize(code):
+        return code.strip().upper()
+
+    def _ref(self, code):
+        return self.repo.collection("joinCodes").document(code)
+
+    def _generate(self):
+        return "".join(secrets.choice(CODE_ALPHABET) for _ in range(self.length))
+
+    def _entry(self, classroom_id):
+        entry = {"classroomId": classroom_id, "active": True, "createdAt": firestore.SERVER_TIMESTAMP}
+        if self.ttl_days:
+            entry["expireAt"] = datetime.now(timezone.utc) + timedelta(days=self.ttl_days)
+        return entry
+
+    async def allocate(self, classroom_id):
+        """Reserve a new unique code for `classroom_id` and return it."""
+        for _ in range(self.max_attempts):
+            code = self._generate()
+            try:
+                await self.repo.run(self._ref(code).create, self._entry(classroom_id))
+                return code
+            except exceptions.AlreadyExists:
+                logger.info(f"Join code collision on {code}, retrying")
+        raise RuntimeError("Could not allocate a unique join code")
+
+    async def resolve(self, code):
+        """Return the classroom id for an active, unexpired code, or None."""
+        code = self.normalize(code)
+        doc = await self.repo.get(self._ref(code))
+        if doc.exists:
+            entry = doc.to_dict()
+            expire_at = entry.get("expireAt")
+            if not entry.get("active", True) or (expire_at and expire_at <= datetime.now(timezone.utc)):
+                return None
+            return entry["classroomId"]
+        return None
+
+    async def rotate(self, classroom_id, old_code=None):
+        """Issue a new code for the classroom, point the classroom at it and retire `old_code`."""
+        code = await self.allocate(classroom_id)
+        batch = self.repo.batch()
+        batch.update(self.repo.collection("classrooms").document(classroom_id), {"joinCode": code})
+        if old_code:
+            batch.set(self._ref(old_code), {"classroomId": classroom_id, "active": False}, merge=True)
+        await self.repo.commit(batch)
+        return code
@@ -0,0 +1,88 @@
+import os
+
+from firebase_admin import firestore
+
+from ttl_cache import TTLCache
+
+TEACHER = "teacher"
+STUDENT = "student"
+
+
+class ClassroomNotFound(LookupError):
+    pass
+
+
+class MembershipIndex:
+    """
+    Classroom authorization without reading the roster.
+
+    Each member has a small document at `classrooms/{id}/members/{userId}`
+    holding their role, so an access check is one point read, and positive
+    answers are cached in-process for MEMBERSHIP_CACHE_TTL_SECONDS (nobody is
+    ever removed from a classroom, so a cached grant cannot go stale).
+    Classrooms created before the index existed are checked once against a
+    field-masked read of the classroom document (`teacherId` and the caller's
+    entry in the legacy `students` map only) and the member document is
+    backfilled.
+    """
+
+    def __init__(self, repo, ttl_seconds=None, max_size=None):
+        self.repo = repo
+        self.ttl_seconds = ttl_seconds or float(os.getenv("MEMBERSHIP_CACHE_TTL_SECONDS", "300"))
+        self.max_size = max_size or int(os.getenv("MEMBERSHIP_CACHE_SIZE", "10000"))
+        self._cache = TTLCache(self.max_size, self.ttl_seconds)
+
+    def members(self, classroom_id):
+        return self.repo.collection("classrooms").document(classroom_id).collection("members")
+
+    async def role(self, classroom_id, user_id):
+        """Return "teacher", "student", or None; raises ClassroomNotFound for unknown legacy lookups."""
+        key = (classroom_id, user_id)
+        role = self._cache.get(key)
+        if role is not None:
+            return role
+
+        member = await self.repo.get(self.members(classroom_id).document(user_id))
+        if member.exists:
+            role = member.to_dict().get("role")
+        else:
+            role = await self._legacy_role(classroom_id, user_id)
+        if role is not None:
+            self._cache.set(key, role)
+        return role
+
+    async def _legacy_role(self, classroom_id, user_id):
+        classroom_ref = self.repo.collection("classrooms").document(classroom_id)
+        classroom = await self.repo.run(classroom_ref.get, field_paths=["teacherId", f"students.`{user_id}`"])
+        if not classroom.exists:
+            raise ClassroomNotFound(classroom_id)
+
+        data = classroom.to_dict() or {}
+        if data.get("teacherId") == user_id:
+            role, profile = TEACHER, {}
+        elif user_id in data.get("students", {}):
+            role, profile = STUDENT, data["students"][user_id]
+        else:
+            return None
+        await self.add(classroom_id, user_id, role, profile)
+        return role
+
+    async def add(self, classroom_id, user_id, role, profile=None):
+        """Create or overwrite a member document (call inside classroom create/join)."""
+        profile = profile or {}
+        await self.repo.set(self.members(classroom_id).document(user_id), {
+            "userId": user_id,
+            "role": role,
+            "name": profile.get("name"),
+            "email": profile.get("email"),
+            "joinedAt": profile.get("joinedAt") or firestore.SERVER_TIMESTAMP,
+        })
+        self._cache.set((classroom_id, user_id), role)
+
+    async def students(self, classroom_id):
+        """The roster as the legacy `students` map shape: {userId: {name, email, joinedAt}}."""
+        docs = await self.repo.stream(self.members(classroom_id).where("role", "==", STUDENT))
+        return {
+            doc.id: {key: value for key, value in doc.to_dict().items() if key in ("name", "email", "joinedAt")}
+            for doc in docs
+        }
@@ -0,0 +1,101 @@
+import base64
+import json
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from firebase_admin import firestore
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+
+
+def encode_cursor(snapshot, order_field: str) -> str:
+    """Opaque cursor holding a document's sort value and id (the tie-breaker)."""
+    value = snapshot.get(order_field)
+    if isinstance(value, datetime):
+        value = {"dt": value.isoformat()}
+    payload = json.dumps({"v": value, "id": snapshot.id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Return (sort value, document id) from a cursor; raises ValueError if malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        value = payload["v"]
+        if isinstance(value, dict) and "dt" in value:
+            value = datetime.fromisoformat(value["dt"])
+        return value, payload["id"]
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+@dataclass
+class Page:
+    items: List[Dict[str, Any]]
+    before: Optional[str] = None  # pass as `before` to load older items
+    after: Optional[str] = None   # pass as `after` to poll for newer items
+    snapshots: List[Any] = field(default_factory=list, repr=False)
+
+    def headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.before:
+            headers["X-Before-Cursor"] = self.before
+        if self.after:
+            headers["X-After-Cursor"] = self.after
+        return headers
+
+
+async def fetch_page(repo, collection_ref, order_field: str = "timestamp", limit: int = DEFAULT_PAGE_SIZE,
+                     before: Optional[str] = None, after: Optional[str] = None,
+                     newest_first: bool = False, where: Optional[Tuple[str, str, Any]] = None,
+                     field_paths: Optional[List[str]] = None) -> Page:
+    """
+    Fetch one page of `collection_ref` ordered by `order_field` then document id.
+
+    With no cursor this is the newest `limit` documents. `before` pages back
+    through history and `after` returns documents newer than the cursor. Items
+    are returned oldest first unless `newest_first` is set. Only `limit + 1`
+    documents are read, the extra one telling us whether older history exists.
+    `where` is an optional (field, op, value) filter and `field_paths` projects
+    the returned documents to those fields.
+    """
+    if before and after:
+        raise ValueError("Pass either before or after, not both")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    direction = firestore.Query.ASCENDING if after else firestore.Query.DESCENDING
+    query = collection_ref.where(*where) if where else collection_ref
+    if field_paths:
+        # The sort field must be selected too so cursors can be built
+        query = query.select(list(dict.fromkeys([*field_paths, order_field])))
+    query = query.order_by(order_field, direction=direction).order_by("__name__", direction=direction)
+    cursor = after or before
+    if cursor:
+        value, doc_id = decode_cursor(cursor)
+        query = query.start_after({order_field: value, "__name__": collection_ref.document(doc_id)})
+
+    docs = await repo.stream(query.limit(limit + 1))
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    if not after:
+        docs.reverse()
+
+    page = Page(items=[doc.to_dict() for doc in docs], snapshots=docs)
+    if docs:
+        # Going backwards we only know older items exist when we over-fetched;
+        # going forwards the `after` cursor's own document is older still.
+        if has_more or after:
+            page.before = encode_cursor(docs[0], order_field)
+        page.after = encode_cursor(docs[-1], order_field)
+    else:
+        # Nothing newer yet: keep handing back the same cursor for polling
+        page.after = after
+
+    if newest_first:
+        page.items.reverse()
+        page.snapshots.reverse()
+    return page
@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+class PdfCache:
+    """
+    On-disk cache of rendered assignment PDFs.
+
+    Entries are keyed by (assignment id, hash of the assignment content,
+    include_answers), so editing an assignment naturally produces a new entry.
+    The key doubles as the HTTP ETag. Concurrent requests for the same missing
+    entry share one render, and the directory is trimmed back under
+    PDF_CACHE_MAX_BYTES by evicting the least recently used files.
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = os.path.abspath(directory or os.getenv("PDF_CACHE_DIR", "./pdf_cache"))
+        self.max_bytes = max_bytes or int(os.getenv("PDF_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+        os.makedirs(self.directory, exist_ok=True)
+        self._inflight = {}
+
+    @staticmethod
+    def content_hash(assignment_data):
+        payload = json.dumps(assignment_data, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def etag_for(self, assignment_id, assignment_data, include_answers):
+        key = f"{assignment_id}:{self.content_hash(assignment_data)}:{int(bool(include_answers))}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _path(self, etag):
+        return os.path.join(self.directory, f"{etag}.pdf")
+
+    def _read(self, etag):
+        path = self._path(etag)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # Touch so eviction sees this entry as recently used; it may have just
+        # been evicted by another request, but we already have the bytes
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data
+
+    def _write(self, etag, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(etag))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pdf"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+                total -= size
+            except FileNotFoundError:
+                pass
+
+    async def get_or_render(self, etag, render):
+        """
+        Return the cached PDF bytes for `etag`, or call the blocking `render()`
+        in a worker thread and cache its result (None results are not cached).
+        """
+        data = await asyncio.to_thread(self._read, etag)
+        if data is not None:
+            return data
+
+        pending = self._inflight.get(etag)
+        if pending is None:
+            async def produce():
+                rendered = await asyncio.to_thread(render)
+                if rendered:
+                    try:
+                        await asyncio.to_thread(self._write, etag, rendered)
+                    except OSError as e:
+                        logger.warning(f"Failed to cache rendered PDF: {str(e)}")
+                return rendered
+
+            pending = asyncio.ensure_future(produce())
+            self._inflight[etag] = pending
+            pending.add_done_callback(lambda _: self._inflight.pop(etag, None))
+
+        return await asyncio.shield(pending)
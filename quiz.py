@@ -1,13 +1,12 @@
-import os
-from google import genai
-from dotenv import load_dotenv
 import json
+from gemini_client import get_client
 
-load_dotenv()
+QUIZ_MODEL = 'gemini-2.0-flash-lite'
+# Bump whenever the prompt below changes so cached quizzes are regenerated
+QUIZ_PROMPT_VERSION = 1
 
-def generate_quiz_json(topic, rag=""):
+async def generate_quiz_json(topic, rag=""):
     print(f"Generating quiz for topic: {topic}, rag: {rag}")
-    client = genai.Client(api_key=os.getenv("GEMINI_API"))
     prompt = f"""
     Generate a Quiz in JSON format for the topic "{topic}". The quiz should include 3-5 questions, each with:
     - A "question" (clear and concise),
@@ -32,8 +31,8 @@ def generate_quiz_json(topic, rag=""):
     }}
     """
     try:
-        response = client.models.generate_content(
-            model='gemini-2.0-flash-lite',
+        response = await get_client().generate_content(
+            model=QUIZ_MODEL,
             contents=prompt,
         )
         import re
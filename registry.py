@@ -0,0 +1,167 @@
+import base64
+import json
+import logging
+import os
+import threading
+
+import firebase_admin
+from dotenv import load_dotenv
+from firebase_admin import credentials, firestore
+
+from embedding_backend import load_embedding_model
+from firestore_repo import FirestoreRepository
+from gemini_client import GeminiModel, get_client
+
+logger = logging.getLogger(__name__)
+
+# Define the ChromaDB path in a single place
+CHROMA_DB_PATH = os.path.abspath("./chroma_db")
+CHROMA_COLLECTION_NAME = "student_submissions"
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+GEMINI_MODEL_NAME = "gemini-2.0-flash"
+
+_firebase_lock = threading.Lock()
+
+
+def init_firebase():
+    """Initialize the default Firebase app on first call and return it on every call."""
+    with _firebase_lock:
+        try:
+            return firebase_admin.get_app()
+        except ValueError:
+            pass
+
+        firebase_creds_base64 = os.environ.get('FIREBASE_ADMIN_CREDENTIALS_B64')
+        if not firebase_creds_base64:
+            # Fallback to local file for development
+            cred = credentials.Certificate("tibby-teach-firebase-adminsdk-fbsvc-a51c5b7b7b.json")
+        else:
+            # Decode and load credentials from base64
+            decoded_json = base64.b64decode(firebase_creds_base64).decode("utf-8")
+            cred_dict = json.loads(decoded_json)
+            cred = credentials.Certificate(cred_dict)
+
+        return firebase_admin.initialize_app(cred)
+
+
+class Registry:
+    """
+    Process-wide home for expensive clients and models.
+
+    Every resource is created on first access and then shared for the life of
+    the worker, so request handlers never construct a model or client
+    themselves. chromadb and sentence-transformers (and with it torch) are
+    only imported when their resource is first built, so importing the app
+    stays fast; the lifespan calls `warm_up()` in the background once the
+    server is accepting traffic, and `status()` reports progress for the
+    readiness check. Each slow resource has its own lock so a loading model
+    never blocks access to Firestore or Gemini.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._model_lock = threading.Lock()
+        self._chroma_lock = threading.Lock()
+        self._status = {"embedding_model": "pending", "chroma_collection": "pending"}
+        self._db = None
+        self._repo = None
+        self._embedding_model = None
+        self._embedding_model_loaded = False
+        self._chroma_client = None
+        self._chroma_collection = None
+        self._gemini_model = None
+
+    @property
+    def db(self):
+        with self._lock:
+            if self._db is None:
+                init_firebase()
+                self._db = firestore.client()
+            return self._db
+
+    @property
+    def repo(self):
+        with self._lock:
+            if self._repo is None:
+                self._repo = FirestoreRepository(self.db)
+            return self._repo
+
+    @property
+    def embedding_model(self):
+        """The shared MiniLM model, or None if it failed to load."""
+        if self._embedding_model_loaded:
+            return self._embedding_model
+        with self._model_lock:
+            if not self._embedding_model_loaded:
+                self._status["embedding_model"] = "loading"
+                try:
+                    self._embedding_model = load_embedding_model(EMBEDDING_MODEL_NAME)
+                    self._status["embedding_model"] = "ready"
+                except Exception as e:
+                    logger.error(f"Failed to load sentence transformer model: {str(e)}")
+                    self._status["embedding_model"] = "failed"
+                self._embedding_model_loaded = True
+            return self._embedding_model
+
+    @property
+    def chroma_collection(self):
+        if self._chroma_collection is not None:
+            return self._chroma_collection
+        with self._chroma_lock:
+            if self._chroma_collection is None:
+                self._status["chroma_collection"] = "loading"
+                try:
+                    import chromadb
+                    self._chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
+                    self._chroma_collection = self._chroma_client.get_or_create_collection(name=CHROMA_COLLECTION_NAME)
+                except Exception:
+                    self._status["chroma_collection"] = "failed"
+                    raise
+                self._status["chroma_collection"] = "ready"
+            return self._chroma_collection
+
+    @property
+    def gemini_client(self):
+        return get_client()
+
+    @property
+    def gemini_model(self):
+        """The class-based generators' model on the shared client, or None if GEMINI_API is not set."""
+        with self._lock:
+            if self._gemini_model is None:
+                load_dotenv()
+                if not os.getenv('GEMINI_API'):
+                    return None
+                self._gemini_model = GeminiModel(self.gemini_client, GEMINI_MODEL_NAME)
+            return self._gemini_model
+
+    def load(self):
+        """Eagerly create every resource."""
+        self.repo
+        self.gemini_model
+        self.warm_up()
+
+    def warm_up(self):
+        """Build the slow resources (vector store, embedding model); safe to run in a background thread."""
+        try:
+            self.chroma_collection
+        except Exception as e:
+            logger.error(f"Failed to open ChromaDB collection: {str(e)}")
+        self.embedding_model
+
+    def status(self):
+        """Load state of each slow resource: pending, loading, ready or failed."""
+        return dict(self._status)
+
+    @property
+    def ready(self):
+        return all(state == "ready" for state in self._status.values())
+
+    def close(self):
+        with self._lock:
+            if self._repo is not None:
+                self._repo.shutdown()
+                self._repo = None
+
+
+registry = Registry()
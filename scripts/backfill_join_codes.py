@@ -0,0 +1,68 @@
+"""
+One-off migration: reserve every classroom's existing join code in `joinCodes`.
+
+Classrooms created before the join code registry only carry `joinCode` on the
+classroom document. Run this once, before deploying the registry, so
+allocation can never hand one of those codes to another classroom:
+
+    python scripts/backfill_join_codes.py [--dry-run]
+
+Codes that are already registered for the same classroom are skipped; a code
+registered to a different classroom is reported as a conflict (that classroom
+needs its code rotated). Uses the same Firebase credentials as the server.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dry-run", action="store_true", help="report what would be written")
+    args = parser.parse_args()
+
+    from firebase_admin import firestore
+    from google.api_core import exceptions
+
+    from join_codes import JoinCodeRegistry
+    from registry import registry
+
+    db = registry.db
+    registered = skipped = 0
+    conflicts = []
+    for classroom in db.collection("classrooms").select(["joinCode"]).stream():
+        code = (classroom.to_dict() or {}).get("joinCode")
+        if not code:
+            continue
+        code = JoinCodeRegistry.normalize(code)
+        code_ref = db.collection("joinCodes").document(code)
+        if args.dry_run:
+            existing = code_ref.get()
+            if existing.exists and existing.to_dict().get("classroomId") != classroom.id:
+                conflicts.append((code, classroom.id, existing.to_dict().get("classroomId")))
+            elif not existing.exists:
+                registered += 1
+            else:
+                skipped += 1
+            continue
+        try:
+            code_ref.create({"classroomId": classroom.id, "active": True, "createdAt": firestore.SERVER_TIMESTAMP})
+            registered += 1
+        except exceptions.AlreadyExists:
+            owner = code_ref.get().to_dict().get("classroomId")
+            if owner == classroom.id:
+                skipped += 1
+            else:
+                conflicts.append((code, classroom.id, owner))
+
+    print(f"{'Would register' if args.dry_run else 'Registered'} {registered} codes, {skipped} already registered")
+    for code, classroom_id, owner in conflicts:
+        print(f"  conflict: {code} on classroom {classroom_id} is registered to {owner}; rotate its code")
+    if conflicts:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+One-off migration: give every file without an uploadTimestamp its creation time.
+
+`/files/list/` orders by uploadTimestamp, and Firestore leaves documents that
+lack the field out of ordered queries, so older files would never be listed.
+Run this once after deploying the paginated listing:
+
+    python scripts/backfill_upload_timestamps.py [--dry-run]
+
+Only the uploadTimestamp field is read. Uses the same Firebase credentials as
+the server.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Firestore rejects batches with more than 500 writes
+BATCH_SIZE = 500
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dry-run", action="store_true", help="count the files without writing")
+    args = parser.parse_args()
+
+    from registry import registry
+
+    db = registry.db
+    missing = [
+        doc for doc in db.collection("files").select(["uploadTimestamp"]).stream()
+        if (doc.to_dict() or {}).get("uploadTimestamp") is None
+    ]
+    if not args.dry_run:
+        for start in range(0, len(missing), BATCH_SIZE):
+            batch = db.batch()
+            for doc in missing[start:start + BATCH_SIZE]:
+                batch.update(doc.reference, {"uploadTimestamp": doc.create_time})
+            batch.commit()
+    print(f"{'Would backfill' if args.dry_run else 'Backfilled'} uploadTimestamp on {len(missing)} files")
+
+
+if __name__ == "__main__":
+    main()
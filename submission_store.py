@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import os
+import random
+
+from firebase_admin import firestore
+from google.api_core import exceptions
+
+from grade_writer import RETRYABLE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Fields mirrored from each submission into the assignment's `submissions` summary map
+SUMMARY_FIELDS = ("submittedAt", "status", "grade", "feedback", "gradedBy")
+
+
+class SubmissionStore:
+    """
+    Submission writes that never touch the assignment document directly.
+
+    The `submissions/{studentId}` subcollection is the source of truth. The
+    submission count lives in SUBMISSION_COUNTER_SHARDS counter documents, and
+    a new submission increments a random one in the same batch that creates
+    the submission, so concurrent submitters rarely share a document.
+
+    The `submissions` map and `submissionCount` on the assignment document are
+    a summary for readers. Changes are queued per assignment and flushed as a
+    single update every SUBMISSION_SUMMARY_DELAY seconds, so a deadline burst
+    costs the hot document one write per interval instead of one per student.
+    Every flush recomputes `submissionCount` from the shards, so a flush lost
+    to a crash is corrected by the next one. Assignments created before the
+    shards existed keep their earlier count as `submissionCountBase`, recorded
+    on their first flush and added to the shard total.
+    """
+
+    def __init__(self, repo, shards=None, summary_delay=None):
+        self.repo = repo
+        self.shards = shards or int(os.getenv("SUBMISSION_COUNTER_SHARDS", "10"))
+        self.summary_delay = summary_delay if summary_delay is not None else \
+            float(os.getenv("SUBMISSION_SUMMARY_DELAY", "2"))
+        self._pending = {}
+        self._tasks = set()
+
+    def _shards(self, assignment_ref):
+        return assignment_ref.collection("submissionCountShards")
+
+    async def submit(self, assignment_ref, student_id, submission_data):
+        """Store a submission; returns True when it is the student's first one."""
+        submission_ref = assignment_ref.collection("submissions").document(student_id)
+        shard_ref = self._shards(assignment_ref).document(str(random.randrange(self.shards)))
+
+        # create() fails if the student already submitted, so the count can't double up
+        batch = self.repo.batch()
+        batch.create(submission_ref, submission_data)
+        batch.set(shard_ref, {"count": firestore.Increment(1)}, merge=True)
+        try:
+            await self.repo.commit(batch)
+            is_first = True
+        except exceptions.AlreadyExists:
+            await self.repo.set(submission_ref, submission_data)
+            is_first = False
+
+        self.record(assignment_ref, student_id, submission_data)
+        return is_first
+
+    async def _tally(self, assignment_ref):
+        """
+        Return (total, unrecorded_base). The base is the count from before the
+        shards existed; until it is stored as `submissionCountBase` the
+        assignment's `submissionCount` is still that legacy count, and it is
+        returned as `unrecorded_base` so the caller can store it.
+        """
+        assignment, shards = await asyncio.gather(
+            self.repo.run(assignment_ref.get, field_paths=["submissionCount", "submissionCountBase"]),
+            self.repo.stream(self._shards(assignment_ref)),
+        )
+        data = (assignment.to_dict() or {}) if assignment.exists else {}
+        sharded = sum((shard.to_dict() or {}).get("count", 0) for shard in shards)
+        if data.get("submissionCountBase") is not None:
+            return data["submissionCountBase"] + sharded, None
+        base = data.get("submissionCount") or 0
+        return base + sharded, base
+
+    async def count(self, assignment_ref):
+        """Total submissions: the pre-shard base plus every counter shard."""
+        total, _ = await self._tally(assignment_ref)
+        return total
+
+    def record(self, assignment_ref, student_id, fields):
+        """Queue a change to the assignment's summary map (flushed in the background)."""
+        entry = self._pending.get(assignment_ref.path)
+        if entry is None:
+            entry = self._pending[assignment_ref.path] = (assignment_ref, {})
+            task = asyncio.create_task(self._flush_later(assignment_ref.path))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        summary = {field: value for field, value in fields.items() if field in SUMMARY_FIELDS}
+        entry[1].setdefault(student_id, {}).update(summary)
+
+    async def _flush_later(self, path):
+        await asyncio.sleep(self.summary_delay)
+        await self._flush(path)
+
+    async def _flush(self, path):
+        entry = self._pending.pop(path, None)
+        if entry is None:
+            return
+        assignment_ref, changes = entry
+        update = {
+            f"submissions.{student_id}.{field}": value
+            for student_id, fields in changes.items()
+            for field, value in fields.items()
+        }
+        try:
+            update["submissionCount"], unrecorded_base = await self._tally(assignment_ref)
+            if unrecorded_base is not None:
+                update["submissionCountBase"] = unrecorded_base
+            await self.repo.update(assignment_ref, update)
+        except RETRYABLE_ERRORS as e:
+            # Requeue; anything recorded meanwhile is merged into the next flush
+            logger.warning(f"Submission summary update failed ({str(e)}), retrying")
+            for student_id, fields in changes.items():
+                self.record(assignment_ref, student_id, fields)
+        except Exception as e:
+            logger.error(f"Failed to update submission summary for {path}: {str(e)}")
+
+    async def flush(self):
+        """Write every queued summary now (called on shutdown)."""
+        await asyncio.gather(*(self._flush(path) for path in list(self._pending)))
@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from firebase_admin import auth
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Public keys Firebase ID tokens are signed with
+ID_TOKEN_CERT_URI = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+
+
+class TokenVerifier:
+    """
+    Verifies Firebase ID tokens off the event loop and remembers the result.
+
+    Decoded tokens are kept in a bounded LRU keyed by the SHA-256 of the raw
+    token (the token itself is never stored or logged) until the token's own
+    `exp`. Concurrent misses for the same token share one verification. A
+    background task keeps Google's signing certs warm in firebase_admin's HTTP
+    cache so a cert rotation never lands on a request.
+    """
+
+    def __init__(self, max_size=None, max_workers=None, cert_refresh_seconds=None):
+        self.max_size = max_size or int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+        self.cert_refresh_seconds = cert_refresh_seconds or int(os.getenv("TOKEN_CERT_REFRESH_SECONDS", "3600"))
+        max_workers = max_workers or int(os.getenv("AUTH_MAX_WORKERS", "8"))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="auth")
+        # Entries expire at the token's own `exp` (wall-clock seconds)
+        self._cache = TTLCache(self.max_size, clock=time.time)
+        self._inflight = {}
+        self._refresh_task = None
+
+    @staticmethod
+    def _key(id_token):
+        return hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+
+    def _store(self, key, decoded):
+        expires_at = decoded.get("exp", 0)
+        if expires_at > time.time():
+            self._cache.set(key, decoded, expires_at)
+
+    async def verify(self, id_token):
+        """Return the decoded token, raising whatever auth.verify_id_token raises."""
+        key = self._key(id_token)
+        decoded = self._cache.get(key)
+        if decoded is not None:
+            return decoded
+
+        pending = self._inflight.get(key)
+        if pending is None:
+            loop = asyncio.get_running_loop()
+            pending = asyncio.ensure_future(loop.run_in_executor(self._executor, auth.verify_id_token, id_token))
+            self._inflight[key] = pending
+            pending.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        decoded = await asyncio.shield(pending)
+        self._store(key, decoded)
+        return decoded
+
+    @staticmethod
+    def _cert_request():
+        # firebase_admin fetches certs through a CacheControl-backed session that
+        # it does not expose publicly; requesting them through that same session
+        # is the only way to refresh the cache verify_id_token reads from.
+        try:
+            return auth._get_client(None)._token_verifier.request
+        except (AttributeError, TypeError, ValueError) as e:
+            logger.warning(f"Token cert refresh disabled, cannot reach firebase_admin's cert session: {str(e)}")
+            return None
+
+    async def _refresh_loop(self, request):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(self._executor, lambda: request(ID_TOKEN_CERT_URI, method="GET"))
+            except Exception as e:
+                logger.warning(f"Failed to refresh token certs: {str(e)}")
+            await asyncio.sleep(self.cert_refresh_seconds)
+
+    def start(self):
+        if self._refresh_task is None:
+            request = self._cert_request()
+            if request is None:
+                # Verification still works; certs are just fetched on demand
+                return
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_loop(request))
+
+    def stop(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+
+# Largest accepted upload and the buffer size used when copying it
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Room for multipart boundaries and the other form fields on top of the file itself
+UPLOAD_FORM_OVERHEAD = int(os.getenv("UPLOAD_FORM_OVERHEAD", str(1024 * 1024)))
+
+
+class UploadTooLarge(ValueError):
+    def __init__(self, max_bytes):
+        super().__init__(f"Upload exceeds the {max_bytes // (1024 * 1024)} MB limit")
+        self.max_bytes = max_bytes
+
+
+class BodySizeLimitMiddleware:
+    """
+    Reject request bodies over MAX_UPLOAD_BYTES (plus UPLOAD_FORM_OVERHEAD)
+    with a 413 before the form parser has spooled them.
+
+    Requests that declare a larger Content-Length are refused without reading
+    the body; otherwise the body is counted as it arrives and the request is
+    cut off as soon as it passes the limit.
+    """
+
+    def __init__(self, app, max_body_bytes=None):
+        self.app = app
+        self.max_body_bytes = max_body_bytes or MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": str(UploadTooLarge(MAX_UPLOAD_BYTES))}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        started = rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    rejected = True
+                    if not started:
+                        await self._reject(send)
+                    # The app sees the client go away and stops reading
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if rejected:
+                return
+            started = True
+            await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
+
+
+def _copy(source, destination, max_bytes, chunk_size):
+    source.seek(0)
+    shutil.copyfileobj(source, destination, chunk_size)
+    if destination.tell() > max_bytes:
+        raise UploadTooLarge(max_bytes)
+    return destination.tell()
+
+
+async def spool_upload(upload, destination=None, suffix=".pdf", max_bytes=None, chunk_size=None):
+    """
+    Copy an UploadFile to disk and return (path, size).
+
+    Starlette has already spooled the upload (to disk once it passes 1 MB), so
+    this copies that file in a worker thread, one buffer at a time, rather than
+    reading it back through the event loop. Oversized uploads raise
+    UploadTooLarge and leave nothing behind; BodySizeLimitMiddleware stops
+    them before they are spooled in the first place. Without a `destination`
+    a temporary file is created; the caller owns (and deletes) the result.
+    """
+    max_bytes = max_bytes or MAX_UPLOAD_BYTES
+    chunk_size = chunk_size or UPLOAD_CHUNK_SIZE
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+
+    if destination is None:
+        fd, destination = tempfile.mkstemp(suffix=suffix)
+        out = os.fdopen(fd, "wb")
+    else:
+        out = open(destination, "wb")
+
+    try:
+        with out:
+            size = await asyncio.to_thread(_copy, upload.file, out, max_bytes, chunk_size)
+    except BaseException:
+        os.remove(destination)
+        raise
+    return destination, size
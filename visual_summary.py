@@ -1,12 +1,13 @@
+import asyncio
 import base64
+from contextlib import aclosing
+import io
 import os
-import mimetypes
-from google import genai
 from google.genai import types
 from dotenv import load_dotenv
 import json
 import cloudinary.uploader
-import random
+from gemini_client import get_client
 
 load_dotenv()
 
@@ -17,11 +18,14 @@ cloudinary.config(
     api_secret=os.getenv("CLOUDINARY_API_SECRET"),
 )
 
-def save_binary_file(file_name, data):
-    with open(file_name, "wb") as f:
-        f.write(data)
+# How many sections generate and upload their images at once
+SECTION_CONCURRENCY = int(os.getenv("VISUAL_SUMMARY_CONCURRENCY", "5"))
 
-def generate_image_prompt(client, section_content):
+SUMMARY_MODEL = 'gemini-2.0-flash-lite'
+# Bump whenever the summary or image prompts change so cached summaries are regenerated
+SUMMARY_PROMPT_VERSION = 1
+
+async def generate_image_prompt(section_content):
     """Use Gemini to generate a tailored image prompt"""
     prompt = f"""
     Create a detailed and creative prompt for an image generation model to produce an illustration that complements 
@@ -34,7 +38,7 @@ def generate_image_prompt(client, section_content):
     Return the prompt as a plain string, no additional formatting.
     """
     try:
-        response = client.models.generate_content(
+        response = await get_client().generate_content(
             model='gemini-2.0-flash-lite',
             contents=prompt,
         )
@@ -44,12 +48,11 @@ def generate_image_prompt(client, section_content):
         # Fallback prompt if generation fails
         return f"Create a vivid illustration capturing the mood and themes of '{section_content}' without replicating the text."
 
-def generate_image(section_content):
+async def generate_image(section_content):
     print(f"Generating image for section content: {section_content}")
-    client = genai.Client(api_key=os.getenv("GEMINI_API"))
 
     # Generate the tailored prompt using Gemini
-    image_prompt = generate_image_prompt(client, section_content)
+    image_prompt = await generate_image_prompt(section_content)
     print(f"Generated image prompt: {image_prompt}")
 
     model = "gemini-2.0-flash-exp-image-generation"
@@ -70,42 +73,41 @@ def generate_image(section_content):
     )
 
     try:
-        for chunk in client.models.generate_content_stream(
+        # aclosing releases the client's concurrency slot as soon as we return
+        async with aclosing(get_client().generate_content_stream(
             model=model,
             contents=contents,
             config=generate_content_config,
-        ):
-            if not chunk.candidates or not chunk.candidates[0].content or not chunk.candidates[0].content.parts:
-                continue
-            if chunk.candidates[0].content.parts[0].inline_data:
-                inline_data = chunk.candidates[0].content.parts[0].inline_data
-                file_extension = mimetypes.guess_extension(inline_data.mime_type)
-                file_name = f"generated_image_{random.randint(1000, 9999)}{file_extension}"
-                save_binary_file(file_name, inline_data.data)
-                print(f"Image generated and saved as {file_name}")
-                return file_name
-            else:
-                print(f"Text response (no image): {chunk.text}")
+        )) as stream:
+            async for chunk in stream:
+                if not chunk.candidates or not chunk.candidates[0].content or not chunk.candidates[0].content.parts:
+                    continue
+                if chunk.candidates[0].content.parts[0].inline_data:
+                    inline_data = chunk.candidates[0].content.parts[0].inline_data
+                    print(f"Image generated ({inline_data.mime_type}, {len(inline_data.data)} bytes)")
+                    return inline_data.data
+                else:
+                    print(f"Text response (no image): {chunk.text}")
         print("No image generated.")
         return None
     except Exception as e:
         print(f"Error generating image: {e}")
         return None
 
-def upload_to_cloudinary(image_path):
-    print(f"Uploading image {image_path} to Cloudinary")
+def upload_to_cloudinary(image_data):
+    """Upload in-memory image bytes; Cloudinary streams file-like objects as multipart."""
+    print(f"Uploading {len(image_data)} byte image to Cloudinary")
     try:
-        response = cloudinary.uploader.upload(image_path)
+        response = cloudinary.uploader.upload(io.BytesIO(image_data))
         print(f"Image uploaded to Cloudinary: {response['secure_url']}")
         return response["secure_url"]
     except Exception as e:
         print(f"Error uploading to Cloudinary: {e}")
         return None
 
-def generate_visual_summary_json(topic, rag):
+async def generate_visual_summary_text(topic, rag):
+    """Generate the summary skeleton (titles and text, empty imageUrls)."""
     print('Received:', topic, rag)
-    load_dotenv()
-    client = genai.Client(api_key=os.getenv("GEMINI_API"))
     prompt = f"""
     Generate a Visual Summary in JSON format for the topic "{topic}". The summary should be divided into 3-5 sections, 
     each representing a key event or era. For each section, include:
@@ -129,8 +131,8 @@ def generate_visual_summary_json(topic, rag):
     }}
     """
     try:
-        response = client.models.generate_content(
-            model='gemini-2.0-flash-lite',
+        response = await get_client().generate_content(
+            model=SUMMARY_MODEL,
             contents=prompt,
         )
         import re
@@ -145,31 +147,39 @@ def generate_visual_summary_json(topic, rag):
         visual_summary = {"title": f"Error generating visual summary for {topic}", "sections": []}
 
     print("Generated visual summary:", visual_summary)
-    
-    for i, section in enumerate(visual_summary.get("sections", [])):
-        image_path = generate_image(section["text"])
-        print(f'Image Path for Section {i+1}: {image_path}')
-        if image_path:
-            image_url = upload_to_cloudinary(image_path)
-            print(f'Image URL for Section {i+1}: {image_url}')
+    return visual_summary
+
+async def generate_section_image(section, semaphore=None):
+    """Generate and upload one section's image, setting its imageUrl on success."""
+    async with semaphore or asyncio.Semaphore(1):
+        image_data = await generate_image(section["text"])
+        if image_data:
+            image_url = await asyncio.to_thread(upload_to_cloudinary, image_data)
+            print(f'Image URL for section "{section.get("title")}": {image_url}')
             if image_url:
                 section["imageUrl"] = image_url
-            try:
-                os.remove(image_path)
-                print(f"Local image file {image_path} removed")
-            except OSError as e:
-                print(f"Error removing file {image_path}: {e}")
+    return section
 
-    with open('visual_summary.json', 'w') as f:
-        json.dump(visual_summary, f, indent=4)
+async def generate_visual_summary_json(topic, rag):
+    visual_summary = await generate_visual_summary_text(topic, rag)
+    if visual_summary is None:
+        return None
+
+    # Fan out every section at once, bounded by SECTION_CONCURRENCY
+    semaphore = asyncio.Semaphore(SECTION_CONCURRENCY)
+    await asyncio.gather(*(
+        generate_section_image(section, semaphore) for section in visual_summary.get("sections", [])
+    ))
     return visual_summary
 
 if __name__ == "__main__":
-    generate_visual_summary_json(
+    visual_summary = asyncio.run(generate_visual_summary_json(
         "World War II",
         """```rag
         R: The war began in 1939 and ended in 1945.
         A: The war involved major world powers and resulted in significant loss of life.
         G: The war led to the establishment of the United Nations and shaped global politics.
         ```"""
-    )
\ No newline at end of file
+    ))
+    with open('visual_summary.json', 'w') as f:
+        json.dump(visual_summary, f, indent=4)